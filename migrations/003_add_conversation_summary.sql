@@ -0,0 +1,10 @@
+-- Migration: Add rolling summary to conversations
+-- Description: Compact summary of older turns plus the id of the last summarized message
+-- Date: 2026-10-16
+
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS summary TEXT;
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS summary_message_id INTEGER;
+
+-- Add comment
+COMMENT ON COLUMN conversations.summary IS 'Resumen rodante de los turnos hasta summary_message_id';
+COMMENT ON COLUMN conversations.summary_message_id IS 'ID del último mensaje incluido en el resumen (marca de agua)';
@@ -0,0 +1,12 @@
+-- Migration: Store Ollama context tokens per conversation
+-- Description: zlib-compressed /api/generate context reused on the next turn
+-- Date: 2026-10-16
+
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS llm_context BYTEA;
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS llm_context_key VARCHAR(32);
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS llm_context_message_id INTEGER;
+
+-- Add comment
+COMMENT ON COLUMN conversations.llm_context IS 'Tokens de context de Ollama (uint32) comprimidos con zlib';
+COMMENT ON COLUMN conversations.llm_context_key IS 'Hash de modelo + system prompt con que se generó el context';
+COMMENT ON COLUMN conversations.llm_context_message_id IS 'Último mensaje cubierto por el context';
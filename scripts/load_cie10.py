@@ -120,3 +120,4 @@ if __name__ == "__main__":
     print("\n" + "=" * 60)
     print("CARGA COMPLETADA")
     print("=" * 60)
+    print("Si la app está corriendo con el índice en memoria: POST /admin/cie10/reindex")
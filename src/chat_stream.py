@@ -0,0 +1,195 @@
+"""
+Protocolo de streaming de /chat.
+
+El streamer produce eventos tipados (ChatEvent) y un renderer los
+convierte al formato pedido por el cliente:
+
+- text: texto plano como siempre (solo la respuesta del modelo; los
+  resultados de tools vuelven al modelo, que los usa en su respuesta)
+- sse: text/event-stream, un frame `event: <tipo>` por evento
+- ndjson: application/x-ndjson, un objeto {"type": ..., ...} por línea
+
+Tipos de evento: conversation_id, queued, token, tool_call, tool_result,
+usage, error y done.
+
+En todos los formatos los tokens se agrupan antes de escribir: los
+tokens consecutivos se fusionan en un solo frame y se despachan al juntar
+stream_coalesce_bytes o tras stream_coalesce_ms desde el primero
+pendiente, en vez de un envío ASGI por token. Los lotes se numeran y
+retienen en stream_registry para poder reanudar el stream.
+"""
+import asyncio
+import json
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Dict, List, Optional
+
+STREAM_FORMATS = ("text", "sse", "ndjson")
+
+MEDIA_TYPES = {
+    "text": "text/plain",
+    "sse": "text/event-stream",
+    "ndjson": "application/x-ndjson",
+}
+
+
+@dataclass
+class ChatEvent:
+    type: str
+    data: Dict[str, Any]
+    seq: Optional[int] = None  # posición en el stream (offset para reanudar)
+
+
+def render_text(event: ChatEvent) -> str:
+    if event.type == "token":
+        return event.data["content"]
+    if event.type == "error":
+        return f"\n{event.data['message']}\n"
+    return ""
+
+
+def render_sse(event: ChatEvent) -> str:
+    # id = seq: EventSource lo reenvía como Last-Event-ID al reconectar
+    head = f"id: {event.seq}\n" if event.seq is not None else ""
+    return f"{head}event: {event.type}\ndata: {json.dumps(event.data, ensure_ascii=False)}\n\n"
+
+
+def render_ndjson(event: ChatEvent) -> str:
+    return json.dumps({"type": event.type, "seq": event.seq, **event.data}, ensure_ascii=False) + "\n"
+
+
+RENDERERS: Dict[str, Callable[[ChatEvent], str]] = {
+    "text": render_text,
+    "sse": render_sse,
+    "ndjson": render_ndjson,
+}
+
+
+def resolve_stream_format(requested: Optional[str], accept: Optional[str]) -> str:
+    """Formato pedido en el body; si no, según el header Accept (default text)"""
+    if requested:
+        return requested
+    accept = accept or ""
+    if "text/event-stream" in accept:
+        return "sse"
+    if "application/x-ndjson" in accept:
+        return "ndjson"
+    return "text"
+
+
+_END = object()  # fin del source en la cola de coalesce_events
+
+
+@dataclass
+class _Token:
+    frame: int  # frame de tokens al que pertenece (lo decide el lector)
+    content: str
+
+
+@dataclass
+class _Deadline:
+    frame: int  # frame que debe despacharse (venció max_delay o llegó a max_bytes)
+
+
+@dataclass
+class _Failure:
+    exc: Exception
+
+
+async def coalesce_events(
+    source: AsyncIterator[ChatEvent],
+    max_delay: float,
+    max_bytes: int,
+    on_frame: Optional[Callable[[], None]] = None,
+) -> AsyncGenerator[List[ChatEvent], None]:
+    """
+    Agrupa eventos en lotes para escribir de una vez.
+
+    Los tokens se acumulan (fusionados en un solo evento token) hasta
+    max_bytes o max_delay segundos; cualquier otro evento despacha lo
+    pendiente junto con él. on_frame se llama al abrir cada frame de tokens,
+    en el mismo paso en que source produce el token: al terminar source el
+    conteo ya está completo aunque los lotes aún no se hayan despachado.
+    """
+    loop = asyncio.get_running_loop()
+    # Un solo lector consume source, decide a qué frame va cada token y
+    # alimenta la cola; los timers de flush dejan su marca en la misma cola
+    queue: "asyncio.Queue[Any]" = asyncio.Queue()
+    timer: Optional[asyncio.TimerHandle] = None
+
+    async def read() -> None:
+        nonlocal timer
+        frame = 0
+        is_open = False
+        size = 0
+        opened_at = 0.0
+        try:
+            async for event in source:
+                if event.type != "token":
+                    is_open = False
+                    queue.put_nowait(event)
+                    continue
+                now = loop.time()
+                if not is_open or now - opened_at >= max_delay:
+                    frame += 1
+                    is_open, size, opened_at = True, 0, now
+                    # Al abrir un frame el anterior ya se despachó (o se despacha al cambiar de frame)
+                    if timer is not None:
+                        timer.cancel()
+                    timer = loop.call_later(max_delay, queue.put_nowait, _Deadline(frame))
+                    if on_frame is not None:
+                        on_frame()
+                content = event.data["content"]
+                queue.put_nowait(_Token(frame, content))
+                size += len(content.encode("utf-8"))
+                if size >= max_bytes:
+                    is_open = False
+                    queue.put_nowait(_Deadline(frame))
+            queue.put_nowait(_END)
+        except Exception as exc:
+            queue.put_nowait(_Failure(exc))
+
+    pending: List[str] = []
+    frame = 0
+
+    def flush(extra: Optional[ChatEvent] = None) -> List[ChatEvent]:
+        batch = [ChatEvent("token", {"content": "".join(pending)})] if pending else []
+        if extra is not None:
+            batch.append(extra)
+        pending.clear()
+        return batch
+
+    reader = asyncio.ensure_future(read())
+    try:
+        while True:
+            item = await queue.get()
+            if isinstance(item, _Token):
+                if item.frame != frame:
+                    if pending:
+                        yield flush()
+                    frame = item.frame
+                pending.append(item.content)
+                continue
+            if isinstance(item, _Deadline):
+                # Marcas de frames ya despachados (o de uno posterior) no aplican
+                if item.frame == frame and pending:
+                    yield flush()
+                continue
+            if item is _END:
+                if pending:
+                    yield flush()
+                return
+            if isinstance(item, _Failure):
+                raise item.exc
+            yield flush(item)
+    finally:
+        if timer is not None:
+            timer.cancel()
+        if not reader.done():
+            reader.cancel()
+            try:
+                await reader
+            except asyncio.CancelledError:
+                pass
+        aclose = getattr(source, "aclose", None)
+        if aclose is not None:
+            await aclose()
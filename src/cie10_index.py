@@ -0,0 +1,271 @@
+"""
+Motor de búsqueda CIE-10 en memoria.
+
+El catálogo (~14.5k códigos) se carga una vez desde la base de datos (o
+desde cie-10.csv si la tabla está vacía) y se indexa en el proceso:
+
+- índice invertido sobre las descripciones, con términos plegados (sin
+  tildes), sin stopwords y con stem liviano (ver text_normalize), y
+  ranking por cobertura (palabras distintas de la consulta presentes,
+  luego números, luego idf) y después BM25: un documento con "diabetes"
+  va antes que uno que solo tiene "tipos"; "diabetes tipo 1/2" se
+  reescribe a los términos de la CIE-10 ((no) insulinodependiente)
+- trie de prefijos sobre los códigos (`E1` -> E10, E11, E10.9, ...)
+- diccionario código -> fila para get_code
+
+Las consultas no tocan la DB ni calculan to_tsvector por fila: son
+lookups en memoria. El índice se construye al arrancar (precarga) o en
+el primer uso, en un thread para no bloquear el event loop. Tras
+recargar la tabla (scripts/load_cie10.py), POST /admin/cie10/reindex lo
+reconstruye.
+"""
+import asyncio
+import csv
+import logging
+import math
+import re
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .db import session_scope
+from .models import CIE10Code
+from .text_normalize import fold_accents, search_terms
+
+logger = logging.getLogger("energyapp.cie10")
+
+CSV_PATH = Path(__file__).resolve().parent.parent / "cie-10.csv"
+CODE_QUERY_RE = re.compile(r"^[A-Z]\d[0-9A-Z\-]*$")
+
+# La CIE-10 no dice "tipo 1/2" sino (no) insulinodependiente: la consulta se reescribe
+QUERY_REWRITES = (
+    (re.compile(r"\bdiabetes(?: mellitus)? tipo (?:1|i)\b"), "diabetes mellitus insulinodependiente"),
+    (re.compile(r"\bdiabetes(?: mellitus)? tipo (?:2|ii)\b"), "diabetes mellitus no insulinodependiente"),
+)
+
+# Parámetros estándar de BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def code_key(code: str) -> str:
+    """Códigos sin espacios ni puntos y en mayúsculas: el CSV guarda `E109` para E10.9"""
+    return "".join(code.split()).replace(".", "").upper()
+
+
+class TrieNode:
+    __slots__ = ("children", "docs")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "TrieNode"] = {}
+        self.docs: List[int] = []  # documentos con este prefijo, ya ordenados
+
+
+def _load_rows_from_db() -> List[Dict[str, Any]]:
+    with session_scope() as session:
+        rows = session.query(  # type: ignore[attr-defined]
+            CIE10Code.id, CIE10Code.code, CIE10Code.description,
+            CIE10Code.level, CIE10Code.parent_code, CIE10Code.is_range,
+        ).all()
+        return [
+            {
+                "id": row.id,
+                "code": row.code,
+                "description": row.description,
+                "level": row.level,
+                "parent_code": row.parent_code,
+                "is_range": bool(row.is_range),
+            }
+            for row in rows
+        ]
+
+
+def _load_rows_from_csv(path: Path) -> List[Dict[str, Any]]:
+    """Misma interpretación que scripts/load_cie10.py (ids por orden de fila)"""
+    rows: List[Dict[str, Any]] = []
+    seen = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            code = row["code"].strip()
+            if code in seen:
+                continue
+            seen.add(code)
+            parent_code = None
+            for i in range(4, -1, -1):
+                value = (row.get(f"code_{i}") or "").strip()
+                if value and value != code:
+                    parent_code = value
+                    break
+            rows.append({
+                "id": len(rows) + 1,
+                "code": code,
+                "description": row["description"].strip(),
+                "level": int(row["level"]),
+                "parent_code": parent_code,
+                "is_range": "-" in code,
+            })
+    return rows
+
+
+class CIE10Index:
+    """Índice invertido BM25 + trie de códigos, inmutable una vez construido"""
+
+    def __init__(self, rows: List[Dict[str, Any]]):
+        # Orden base: específicos antes que rangos, luego por código (igual que la búsqueda SQL)
+        self.docs = sorted(rows, key=lambda r: (r["is_range"], r["code"]))
+        self.by_code: Dict[str, int] = {}
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.doc_len: List[int] = []
+        self.trie = TrieNode()
+
+        for doc_id, doc in enumerate(self.docs):
+            code = code_key(doc["code"])
+            self.by_code[code] = doc_id
+            node = self.trie
+            for char in code:
+                node = node.children.setdefault(char, TrieNode())
+                node.docs.append(doc_id)
+
+            terms = search_terms(doc["description"])
+            self.doc_len.append(len(terms))
+            for term, tf in Counter(terms).items():
+                self.postings[term].append((doc_id, tf))
+
+        total = len(self.docs)
+        self.avg_len = (sum(self.doc_len) / total) if total else 0.0
+        self.idf: Dict[str, float] = {
+            term: math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def get_code(self, code: str) -> Optional[Dict[str, Any]]:
+        doc_id = self.by_code.get(code_key(code))
+        return self.docs[doc_id] if doc_id is not None else None
+
+    def prefix(self, prefix: str, limit: int) -> List[int]:
+        node: Optional[TrieNode] = self.trie
+        for char in prefix:
+            node = node.children.get(char) if node is not None else None
+            if node is None:
+                return []
+        return node.docs[:limit]  # type: ignore[union-attr]
+
+    def bm25(self, query: str, limit: int) -> List[int]:
+        """
+        Documentos por cantidad de palabras de la consulta que contienen; a
+        igual cantidad, los que además tienen sus números, luego los que
+        cubren las palabras más raras (suma de idf) y por último BM25.
+        """
+        query = fold_accents(query)
+        for pattern, replacement in QUERY_REWRITES:
+            query = pattern.sub(replacement, query)
+        scores: Dict[int, float] = defaultdict(float)
+        words: Dict[int, int] = defaultdict(int)
+        numbers: Dict[int, int] = defaultdict(int)
+        covered: Dict[int, float] = defaultdict(float)
+        for term in set(search_terms(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf[term]
+            is_number = term.isdigit()
+            for doc_id, tf in postings:
+                norm = 1 - BM25_B + BM25_B * self.doc_len[doc_id] / self.avg_len
+                scores[doc_id] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+                if is_number:
+                    # Los números aparecen sueltos en referencias (G05.2): solo desempatan
+                    numbers[doc_id] += 1
+                else:
+                    words[doc_id] += 1
+                    covered[doc_id] += idf
+        # Un término frecuente en descripciones cortas ("tipos") no debe ganarle al
+        # término informativo ("diabetes") solo por la normalización de largo.
+        # Empates: el orden base (doc_id) deja específicos primero y luego por código
+        ranked = sorted(
+            scores.items(),
+            key=lambda item: (
+                -words[item[0]], -numbers[item[0]], -round(covered[item[0]], 6), -item[1], item[0],
+            ),
+        )
+        return [doc_id for doc_id, _ in ranked[:limit]]
+
+    def search(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Si parece un código: coincidencia exacta y por prefijo primero; luego BM25"""
+        code = code_key(query)
+        ids: List[int] = []
+        if CODE_QUERY_RE.match(code):
+            exact = self.by_code.get(code)
+            if exact is not None:
+                ids.append(exact)
+            ids.extend(doc_id for doc_id in self.prefix(code, limit + 1) if doc_id != exact)
+        if len(ids) < limit:
+            seen = set(ids)
+            ids.extend(doc_id for doc_id in self.bm25(query, limit) if doc_id not in seen)
+        return [self.docs[doc_id] for doc_id in ids[:limit]]
+
+    def stats(self) -> Dict[str, Any]:
+        ranges = sum(1 for doc in self.docs if doc["is_range"])
+        levels: Dict[str, int] = {"0": 0, "1": 0, "2": 0}
+        for doc in self.docs:
+            levels[str(doc["level"])] = levels.get(str(doc["level"]), 0) + 1
+        return {
+            "total_codes": len(self.docs),
+            "ranges": ranges,
+            "specific_codes": len(self.docs) - ranges,
+            "levels": levels,
+        }
+
+
+def build_index() -> CIE10Index:
+    started = time.perf_counter()
+    rows = _load_rows_from_db()
+    source = "db"
+    if not rows and CSV_PATH.exists():
+        rows = _load_rows_from_csv(CSV_PATH)
+        source = "csv"
+    index = CIE10Index(rows)
+    logger.info(
+        f"CIE10_INDEX_BUILT | source={source}, codes={len(index)}, terms={len(index.postings)}, "
+        f"ms={round((time.perf_counter() - started) * 1000, 1)}"
+    )
+    return index
+
+
+class CIE10IndexHolder:
+    """Construcción única (lazy o en precarga) del índice compartido"""
+
+    def __init__(self) -> None:
+        self.index: Optional[CIE10Index] = None
+        self._lock = asyncio.Lock()
+        self._generation = 0  # sube con cada invalidate
+
+    async def get(self) -> CIE10Index:
+        while self.index is None:
+            async with self._lock:
+                if self.index is None:
+                    generation = self._generation
+                    index = await asyncio.to_thread(build_index)
+                    # Si se invalidó durante la construcción, pudo leer la tabla vieja: se descarta
+                    if generation == self._generation:
+                        self.index = index
+        return self.index
+
+    def invalidate(self) -> None:
+        """Fuerza reconstruir en el próximo uso (tras recargar la tabla, ver /admin/cie10/reindex)"""
+        self._generation += 1
+        self.index = None
+
+
+# Singleton
+_holder: Optional[CIE10IndexHolder] = None
+
+
+def get_cie10_index() -> CIE10IndexHolder:
+    global _holder
+    if _holder is None:
+        _holder = CIE10IndexHolder()
+    return _holder
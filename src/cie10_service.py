@@ -0,0 +1,163 @@
+"""
+Servicio de búsqueda CIE-10.
+
+Interfaz async compartida por el router /cie10 y las tools del chat:
+
+- local: en el mismo proceso (default); con cie10_index_enabled responde
+  desde el índice en memoria (cie10_index), si no consulta la DB
+- remote: llama a la API /cie10 de otra instancia (despliegues separados),
+  con el pool HTTP compartido
+
+Los resultados son dicts con los campos de CIE10CodeResponse.
+"""
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+from urllib.parse import quote
+
+from sqlalchemy import func, or_
+
+from .cie10_index import CIE10IndexHolder, get_cie10_index
+from .config import get_settings
+from .db import session_scope
+from .http_pool import get_http_pool
+from .models import CIE10Code
+
+
+def code_to_dict(code: CIE10Code) -> Dict[str, Any]:
+    return {
+        "id": code.id,  # type: ignore[attr-defined]
+        "code": code.code,  # type: ignore[attr-defined]
+        "description": code.description,  # type: ignore[attr-defined]
+        "level": code.level,  # type: ignore[attr-defined]
+        "parent_code": code.parent_code,  # type: ignore[attr-defined]
+        "is_range": code.is_range,  # type: ignore[attr-defined]
+    }
+
+
+class CIE10Service(ABC):
+    """Interfaz de búsqueda CIE-10"""
+
+    # search() ignora tildes ("hipertension" == "hipertensión"): solo entonces
+    # las tools pueden compartir resultados de cache entre ambas grafías
+    folds_accents = False
+
+    @abstractmethod
+    async def search(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def get_code(self, code: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def stats(self) -> Dict[str, Any]:
+        ...
+
+
+class LocalCIE10Service(CIE10Service):
+    """Índice en memoria o consultas directas a la DB (en un thread, para no bloquear el event loop)"""
+
+    def __init__(self, index: Optional[CIE10IndexHolder] = None):
+        self.index = index
+        # El índice en memoria pliega tildes; el full-text 'spanish' de Postgres no
+        self.folds_accents = index is not None
+
+    @staticmethod
+    def _search(q: str, limit: int) -> List[Dict[str, Any]]:
+        with session_scope() as session:
+            query = session.query(CIE10Code)  # type: ignore[attr-defined]
+            fulltext = func.to_tsvector('spanish', CIE10Code.description).op('@@')(
+                func.plainto_tsquery('spanish', q)
+            )
+            # Si el término parece un código (empieza con letra o contiene números)
+            if q[0].isalpha() or any(c.isdigit() for c in q):
+                # Búsqueda por código (case-insensitive) O por full-text
+                query = query.filter(or_(func.upper(CIE10Code.code).contains(q.upper()), fulltext))
+            else:
+                # Solo búsqueda por descripción
+                query = query.filter(fulltext)
+            # Ordenar por relevancia: códigos específicos primero, luego por código
+            rows = query.order_by(CIE10Code.is_range, CIE10Code.code).limit(limit).all()
+            return [code_to_dict(row) for row in rows]
+
+    @staticmethod
+    def _get_code(code: str) -> Optional[Dict[str, Any]]:
+        with session_scope() as session:
+            row = session.query(CIE10Code).filter(  # type: ignore[attr-defined]
+                func.upper(CIE10Code.code) == code.upper()
+            ).first()
+            return code_to_dict(row) if row else None
+
+    @staticmethod
+    def _stats() -> Dict[str, Any]:
+        with session_scope() as session:
+            codes = session.query(CIE10Code)  # type: ignore[attr-defined]
+            return {
+                "total_codes": codes.count(),
+                "ranges": codes.filter(CIE10Code.is_range == True).count(),
+                "specific_codes": codes.filter(CIE10Code.is_range == False).count(),
+                "levels": {
+                    str(level): codes.filter(CIE10Code.level == level).count() for level in (0, 1, 2)
+                },
+            }
+
+    async def search(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        if self.index is not None:
+            return (await self.index.get()).search(query, limit)
+        return await asyncio.to_thread(self._search, query, limit)
+
+    async def get_code(self, code: str) -> Optional[Dict[str, Any]]:
+        if self.index is not None:
+            return (await self.index.get()).get_code(code)
+        return await asyncio.to_thread(self._get_code, code)
+
+    async def stats(self) -> Dict[str, Any]:
+        if self.index is not None:
+            return (await self.index.get()).stats()
+        return await asyncio.to_thread(self._stats)
+
+
+class RemoteCIE10Service(CIE10Service):
+    """API /cie10 de otra instancia (conexiones keep-alive del pool)"""
+
+    def __init__(self, base_url: str, timeout: float = 10.0):
+        self.base_url = base_url
+        self.timeout = timeout
+
+    async def search(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        response = await get_http_pool().request(
+            self.base_url, "GET", "/cie10/search", params={"q": query, "limit": limit}, timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def get_code(self, code: str) -> Optional[Dict[str, Any]]:
+        # El código viene del modelo: sin quote, un "/" o "?" cambiaría la ruta pedida
+        response = await get_http_pool().request(
+            self.base_url, "GET", f"/cie10/{quote(code, safe='')}", timeout=self.timeout
+        )
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    async def stats(self) -> Dict[str, Any]:
+        response = await get_http_pool().request(self.base_url, "GET", "/cie10/", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+
+# Singleton
+_cie10_service: Optional[CIE10Service] = None
+
+
+def get_cie10_service() -> CIE10Service:
+    global _cie10_service
+    if _cie10_service is None:
+        settings = get_settings()
+        if settings.cie10_service_mode == "remote":
+            _cie10_service = RemoteCIE10Service(settings.cie10_service_url)
+        else:
+            _cie10_service = LocalCIE10Service(get_cie10_index() if settings.cie10_index_enabled else None)
+    return _cie10_service
@@ -1,7 +1,14 @@
 from functools import lru_cache
+from typing import Literal
 from pathlib import Path
 from pydantic_settings import BaseSettings
-from pydantic import Field
+from pydantic import BaseModel, Field
+
+
+class OllamaBackendConfig(BaseModel):
+    """Backend Ollama del pool (peso relativo para el balanceo)"""
+    url: str
+    weight: float = 1.0
 
 
 class Settings(BaseSettings):
@@ -23,6 +30,81 @@ class Settings(BaseSettings):
     ollama_temperature: float = 0.6
     ollama_top_p: float = 0.9
     ollama_max_tokens: int = 512
+    # Ventana de contexto pedida al modelo (num_ctx); limita el historial enviado
+    ollama_num_ctx: int = 4096
+    context_history_max_tokens: int = 0  # tope extra para historial (0 = solo num_ctx)
+    # Residencia de modelos: precarga y keep_alive (formato de duración de Ollama)
+    ollama_keep_alive: str = "30m"
+    residency_enabled: bool = True
+    residency_interval_seconds: float = 60.0  # cada cuánto se revisa /api/ps
+    residency_traffic_window_seconds: float = 1800.0  # tráfico que mantiene un modelo caliente
+    # Streaming de /chat: agrupación de tokens por tiempo/tamaño (todos los formatos)
+    stream_coalesce_ms: float = 25.0
+    stream_coalesce_bytes: int = 512
+    # Streams reanudables: eventos retenidos, espera de re-enganche y retención al terminar
+    stream_buffer_max_events: int = 2000
+    stream_resume_grace_seconds: float = 30.0
+    stream_retention_seconds: float = 120.0
+    idempotency_ttl_seconds: float = 600.0  # ventana de reintentos con Idempotency-Key
+    # Servicio CIE-10: local (DB en proceso) | remote (API /cie10 de otra instancia)
+    cie10_service_mode: Literal["local", "remote"] = "local"
+    cie10_service_url: str = "http://127.0.0.1:8001"
+    # Modo local: búsqueda en un índice en memoria (BM25 + trie de códigos) en vez de la DB
+    cie10_index_enabled: bool = True
+    cie10_index_preload: bool = True  # construirlo al arrancar (si no, en el primer uso)
+    # Tool calling en /chat; sin tools se usa /api/generate y se reutiliza su context
+    chat_tools_enabled: bool = True
+    # Rondas tool calls -> resultados -> modelo por respuesta; la última va sin tools
+    chat_max_tool_rounds: int = 3
+    chat_tool_timeout_seconds: float = 10.0
+    # Búsquedas CIE-10 anticipadas desde el prompt, en paralelo con la primera ronda
+    chat_tool_prefetch: bool = True
+    chat_tool_prefetch_max: int = 3
+    ollama_context_reuse: bool = True
+    # Resumen rodante de conversaciones largas (job en background)
+    summary_enabled: bool = True
+    summary_trigger_tokens: int = 1500  # tokens sin resumir que disparan un resumen
+    summary_keep_recent_messages: int = 6  # mensajes recientes que quedan textuales
+    summary_max_tokens: int = 256
+    # Pool de backends; vacio = solo ollama_host.
+    # Ej: ENERGYAPP_OLLAMA_BACKENDS='[{"url": "http://10.0.0.2:11434", "weight": 2}]'
+    ollama_backends: list[OllamaBackendConfig] = Field(default_factory=list)
+    ollama_eject_after_failures: int = 3  # fallos consecutivos antes de expulsar
+    ollama_eject_seconds: float = 30.0  # tiempo fuera de rotacion
+    # Afinidad por conversacion: streams extra tolerados en el nodo preferido
+    ollama_affinity_max_extra_inflight: int = 2
+    # Control de admision: generaciones simultaneas por (backend, modelo)
+    ollama_max_concurrency: int = 2
+    ollama_model_concurrency: dict[str, int] = Field(default_factory=dict)
+    ollama_queue_max: int = 20  # cola de espera en la app
+    ollama_queue_timeout: float = 120.0  # segundos maximos en cola
+    # Fair queuing: peso por rol (mayor peso = mayor fraccion de slots)
+    scheduler_role_weights: dict[str, float] = Field(
+        default_factory=lambda: {"admin": 2.0, "supervisor": 3.0, "trabajador": 1.0, "usuario": 1.0}
+    )
+    scheduler_max_pending_per_user: int = 5  # sobre esto -> 429
+
+    # Cache exacto de respuestas del LLM
+    llm_cache_enabled: bool = True
+    llm_cache_max_entries: int = 1000
+    llm_cache_max_bytes: int = 32 * 1024 * 1024
+    llm_cache_ttl_seconds: float = 6 * 3600
+
+    # Cache semantico (embeddings de Ollama + indice NumPy en disco)
+    semantic_cache_enabled: bool = False
+    semantic_cache_embed_model: str = "nomic-embed-text"
+    semantic_cache_threshold: float = 0.92  # similitud coseno minima
+    semantic_cache_capacity: int = 5000
+    semantic_cache_ttl_seconds: float = 24 * 3600
+    semantic_cache_dir: str = "./data/semantic_cache"
+
+    # Pool HTTP hacia Ollama (keep-alive compartido)
+    ollama_pool_max_connections: int = 20
+    ollama_pool_max_keepalive: int = 10
+    ollama_pool_keepalive_expiry: float = 60.0  # segundos
+    ollama_connect_timeout: float = 5.0
+    ollama_first_byte_timeout: float = 120.0  # incluye carga del modelo en CPU
+    ollama_stream_idle_timeout: float = 60.0
 
     # Database
     db_url: str = Field(
@@ -0,0 +1,161 @@
+"""
+Armado del contexto multi-turno para /chat.
+
+Carga los mensajes previos de la conversación contra un presupuesto de
+tokens derivado del tamaño de contexto del modelo (num_ctx menos la
+respuesta, el system prompt, el prompt actual y las tools). La carga es
+incremental: se leen páginas de los mensajes más recientes hacia atrás
+(keyset por id) y se corta apenas el presupuesto se llena, así una
+conversación larga no lee todo su historial en cada turno. Los turnos
+que no caben se descartan.
+
+Si la conversación tiene resumen rodante (ver conversation_summary), solo
+se cargan los mensajes posteriores a su marca de agua y el resumen viaja
+como un mensaje system adicional.
+
+En modo sin tools (/api/generate) se reutiliza además el array `context`
+que devuelve Ollama: guardado comprimido en la conversación, permite
+enviar solo el prompt nuevo sin re-evaluar el historial.
+"""
+import hashlib
+import json
+import math
+import zlib
+from array import array
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from .config import Settings
+from .models import Message
+
+# Sin tokenizer del modelo a mano: ~3.5 caracteres por token en español
+CHARS_PER_TOKEN = 3.5
+# Tokens de plantilla por mensaje (rol, separadores)
+MESSAGE_OVERHEAD_TOKENS = 4
+HISTORY_PAGE_SIZE = 20
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación conservadora de tokens de un texto"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) + MESSAGE_OVERHEAD_TOKENS
+
+
+def history_budget(
+    settings: Settings,
+    system: Optional[str],
+    prompt: str,
+    tools: Optional[List[Dict[str, Any]]] = None,
+    summary: Optional[str] = None,
+) -> int:
+    """Tokens disponibles para historial dentro de num_ctx"""
+    used = settings.ollama_max_tokens + estimate_tokens(prompt)
+    if system:
+        used += estimate_tokens(system)
+    if summary:
+        used += estimate_tokens(summary_message(summary)["content"])
+    if tools:
+        used += estimate_tokens(json.dumps(tools, ensure_ascii=False))
+    budget = settings.ollama_num_ctx - used
+    if settings.context_history_max_tokens:
+        budget = min(budget, settings.context_history_max_tokens)
+    return max(budget, 0)
+
+
+def load_history(
+    session: Session,
+    conversation_id: int,
+    budget: int,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    page_size: int = HISTORY_PAGE_SIZE,
+) -> List[Dict[str, str]]:
+    """
+    Mensajes previos (user/assistant) en orden cronológico que caben en budget.
+
+    before_id excluye el mensaje actual y posteriores; after_id limita a
+    mensajes más nuevos que ese id.
+    """
+    selected: List[Dict[str, str]] = []
+    remaining = budget
+    cursor = before_id
+    while remaining > 0:
+        query = session.query(Message.id, Message.role, Message.content).filter(  # type: ignore[attr-defined]
+            Message.conversation_id == conversation_id,
+            Message.role.in_(("user", "assistant")),  # type: ignore[attr-defined]
+        )
+        if cursor is not None:
+            query = query.filter(Message.id < cursor)
+        if after_id is not None:
+            query = query.filter(Message.id > after_id)
+        rows = query.order_by(Message.id.desc()).limit(page_size).all()  # type: ignore[attr-defined]
+        if not rows:
+            break
+        for msg_id, role, content in rows:
+            cost = estimate_tokens(content)
+            if cost > remaining:
+                remaining = 0
+                break
+            remaining -= cost
+            selected.append({"role": role, "content": content})
+            cursor = msg_id
+        if len(rows) < page_size:
+            break
+    selected.reverse()
+    return selected
+
+
+def summary_message(summary: str) -> Dict[str, str]:
+    return {"role": "system", "content": f"Resumen de la conversación hasta ahora:\n{summary}"}
+
+
+def build_messages(
+    system: Optional[str],
+    history: List[Dict[str, str]],
+    prompt: str,
+    summary: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Array messages para /api/chat"""
+    messages: List[Dict[str, Any]] = []
+    if system:
+        messages.append({"role": "system", "content": system})
+    if summary:
+        messages.append(summary_message(summary))
+    messages.extend(history)
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
+
+def render_transcript(
+    history: List[Dict[str, str]],
+    prompt: str,
+    summary: Optional[str] = None,
+) -> str:
+    """Historial aplanado en un solo prompt (para /api/generate sin context)"""
+    labels = {"user": "Usuario", "assistant": "Asistente"}
+    parts: List[str] = []
+    if summary:
+        parts.append(f"Resumen de la conversación hasta ahora:\n{summary}\n")
+    if history:
+        parts.append("Conversación previa:")
+        parts.extend(f"{labels.get(t['role'], t['role'])}: {t['content']}" for t in history)
+        parts.append("")
+    parts.append(prompt)
+    return "\n".join(parts)
+
+
+def context_key(model: str, system: Optional[str]) -> str:
+    """Un context de Ollama solo es válido para el mismo modelo y system prompt"""
+    raw = json.dumps([model, system or ""], ensure_ascii=False)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def pack_context(tokens: List[int]) -> bytes:
+    """Tokens de context como uint32 comprimidos con zlib"""
+    return zlib.compress(array("I", tokens).tobytes())
+
+
+def unpack_context(blob: bytes) -> List[int]:
+    tokens = array("I")
+    tokens.frombytes(zlib.decompress(blob))
+    return tokens.tolist()
@@ -0,0 +1,161 @@
+"""
+Resúmenes rodantes de conversaciones largas.
+
+Después de cada turno se agenda (en background, una task por conversación)
+una revisión: si los mensajes posteriores a la marca de agua
+(Conversation.summary_message_id) superan summary_trigger_tokens, los más
+antiguos se condensan junto al resumen anterior en un nuevo resumen, y la
+marca avanza hasta el último mensaje resumido. Los summary_keep_recent_messages
+más nuevos siempre quedan fuera del resumen para enviarse textuales.
+
+El context builder envía resumen + turnos posteriores a la marca, así el
+prompt no crece sin límite en conversaciones que duran semanas.
+"""
+import asyncio
+import json
+import logging
+from typing import Dict, List, Optional, Set
+
+import httpx
+from sqlalchemy import func
+
+from .config import get_settings
+from .context_builder import CHARS_PER_TOKEN
+from .db import session_scope
+from .models import Conversation, Message
+from .ollama_client import OllamaClient
+
+logger = logging.getLogger("energyapp.summary")
+
+SUMMARY_INSTRUCTIONS = (
+    "Eres un asistente que resume conversaciones. Actualiza el resumen con los "
+    "turnos nuevos. Conserva datos concretos (códigos CIE-10, diagnósticos, "
+    "nombres, cifras, decisiones y preguntas pendientes). Responde solo con el "
+    "resumen, en español, en texto plano y sin preámbulos."
+)
+
+
+def _render_turns(turns: List[Dict[str, str]]) -> str:
+    labels = {"user": "Usuario", "assistant": "Asistente"}
+    return "\n".join(f"{labels.get(t['role'], t['role'])}: {t['content']}" for t in turns)
+
+
+class ConversationSummarizer:
+    """Agenda y ejecuta la actualización de resúmenes (una a la vez por conversación)"""
+
+    def __init__(self, trigger_tokens: int, keep_recent: int, max_tokens: int):
+        self.trigger_tokens = trigger_tokens
+        self.keep_recent = keep_recent
+        self.max_tokens = max_tokens
+        self._running: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self.runs = 0
+        self.failures = 0
+
+    def schedule(self, conversation_id: int) -> None:
+        """Revisa la conversación en background (no-op si ya hay una revisión en curso)"""
+        if conversation_id in self._running:
+            return
+        self._running.add(conversation_id)
+        task = asyncio.create_task(self._refresh(conversation_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _pending(self, conversation_id: int) -> Optional[Dict]:
+        """Turnos a resumir si lo no resumido supera el umbral (None si no aplica)"""
+        with session_scope() as session:
+            conv = session.get(Conversation, conversation_id)
+            if conv is None:
+                return None
+            watermark = conv.summary_message_id or 0
+            unsummarized = session.query(func.coalesce(func.sum(func.length(Message.content)), 0)).filter(  # type: ignore[attr-defined]
+                Message.conversation_id == conversation_id,
+                Message.id > watermark,
+            ).scalar()
+            if unsummarized / CHARS_PER_TOKEN < self.trigger_tokens:
+                return None
+            rows = (
+                session.query(Message.id, Message.role, Message.content)  # type: ignore[attr-defined]
+                .filter(
+                    Message.conversation_id == conversation_id,
+                    Message.id > watermark,
+                    Message.role.in_(("user", "assistant")),  # type: ignore[attr-defined]
+                )
+                .order_by(Message.id)
+                .all()
+            )
+            older = rows[:-self.keep_recent] if self.keep_recent else rows
+            if not older:
+                return None
+            return {
+                "watermark": watermark,
+                "summary": conv.summary,
+                "turns": [{"role": role, "content": content} for _, role, content in older],
+                "last_id": older[-1][0],
+            }
+
+    async def _summarize(self, previous: Optional[str], turns: List[Dict[str, str]]) -> Optional[str]:
+        prompt = (
+            f"Resumen anterior:\n{previous or '(vacío)'}\n\n"
+            f"Turnos nuevos:\n{_render_turns(turns)}\n\n"
+            "Resumen actualizado:"
+        )
+        client = OllamaClient()
+        client.max_tokens = self.max_tokens
+        raw = ""
+        async for line in client.generate(prompt=prompt, system=SUMMARY_INSTRUCTIONS, stream=False, use_cache=False):
+            raw += line
+        data = json.loads(raw)
+        summary = (data.get("response") or data.get("message", {}).get("content") or "").strip()
+        return summary or None
+
+    async def _refresh(self, conversation_id: int) -> None:
+        try:
+            pending = self._pending(conversation_id)
+            if pending is None:
+                return
+            summary = await self._summarize(pending["summary"], pending["turns"])
+            if summary is None:
+                return
+            with session_scope() as session:
+                conv = session.get(Conversation, conversation_id)
+                # Si otra revisión movió la marca mientras tanto, se descarta este resumen
+                if conv is None or (conv.summary_message_id or 0) != pending["watermark"]:
+                    return
+                conv.summary = summary
+                conv.summary_message_id = pending["last_id"]
+            self.runs += 1
+            logger.info(
+                f"SUMMARY_UPDATED | conversation_id={conversation_id}, "
+                f"turns={len(pending['turns'])}, watermark={pending['last_id']}"
+            )
+        except (httpx.HTTPError, ValueError) as exc:
+            self.failures += 1
+            logger.warning(f"SUMMARY_FAILED | conversation_id={conversation_id}, error={exc}")
+        except Exception:
+            self.failures += 1
+            logger.exception(f"SUMMARY_FAILED | conversation_id={conversation_id}")
+        finally:
+            self._running.discard(conversation_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {"running": len(self._running), "runs": self.runs, "failures": self.failures}
+
+
+# Singleton
+_summarizer: Optional[ConversationSummarizer] = None
+
+
+def get_summarizer() -> Optional[ConversationSummarizer]:
+    """Instancia compartida, o None si los resúmenes están deshabilitados"""
+    global _summarizer
+    settings = get_settings()
+    if not settings.summary_enabled:
+        return None
+    if _summarizer is None:
+        _summarizer = ConversationSummarizer(
+            trigger_tokens=settings.summary_trigger_tokens,
+            keep_recent=settings.summary_keep_recent_messages,
+            max_tokens=settings.summary_max_tokens,
+        )
+    return _summarizer
@@ -0,0 +1,196 @@
+"""
+Pool compartido de clientes HTTP con keep-alive.
+
+Un único httpx.AsyncClient por backend (Ollama u otro servicio interno),
+creado perezosamente y cerrado en el shutdown de la app. Evita abrir una
+conexión TCP nueva por cada /chat y expone estadísticas del pool.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field, asdict
+from typing import AsyncGenerator, Any, Dict, Optional
+
+import httpx
+
+from .config import get_settings
+
+logger = logging.getLogger("energyapp.http_pool")
+
+
+@dataclass
+class PoolStats:
+    """Contadores por backend"""
+    requests: int = 0
+    streams: int = 0
+    active_streams: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    created_at: float = field(default_factory=time.time)
+
+
+class HTTPClientPool:
+    """Clientes httpx reutilizables, uno por base_url."""
+
+    def __init__(
+        self,
+        max_connections: int,
+        max_keepalive: int,
+        keepalive_expiry: float,
+        connect_timeout: float,
+        first_byte_timeout: float,
+        stream_idle_timeout: float,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.connect_timeout = connect_timeout
+        self.first_byte_timeout = first_byte_timeout
+        self.stream_idle_timeout = stream_idle_timeout
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._stats: Dict[str, PoolStats] = {}
+
+    @staticmethod
+    def _key(base_url: str) -> str:
+        return base_url.rstrip("/")
+
+    def get_client(self, base_url: str) -> httpx.AsyncClient:
+        """Retorna (o crea) el cliente compartido para base_url"""
+        key = self._key(base_url)
+        client = self._clients.get(key)
+        if client is None or client.is_closed:
+            # El read timeout de httpx cubre el peor caso; los límites finos
+            # (primer byte / inactividad) se aplican en stream_lines.
+            timeout = httpx.Timeout(
+                connect=self.connect_timeout,
+                read=max(self.first_byte_timeout, self.stream_idle_timeout),
+                write=self.connect_timeout,
+                pool=self.connect_timeout,
+            )
+            client = httpx.AsyncClient(base_url=key, limits=self.limits, timeout=timeout)
+            self._clients[key] = client
+            self._stats.setdefault(key, PoolStats())
+            logger.info(f"HTTP_POOL_CREATE | base_url={key}")
+        return client
+
+    async def request(self, base_url: str, method: str, path: str, **kwargs: Any) -> httpx.Response:
+        """Request no-streaming usando el cliente compartido"""
+        client = self.get_client(base_url)
+        stats = self._stats[self._key(base_url)]
+        stats.requests += 1
+        try:
+            return await client.request(method, path, **kwargs)
+        except httpx.TimeoutException:
+            stats.timeouts += 1
+            raise
+        except httpx.HTTPError:
+            stats.errors += 1
+            raise
+
+    async def stream_lines(
+        self,
+        base_url: str,
+        path: str,
+        json: Optional[Dict[str, Any]] = None,
+        method: str = "POST",
+    ) -> AsyncGenerator[str, None]:
+        """
+        Hace streaming de líneas (NDJSON) con timeouts separados.
+
+        - first_byte_timeout: desde el envío hasta la primera línea
+          (incluye carga del modelo y evaluación del prompt)
+        - stream_idle_timeout: máximo entre líneas sucesivas
+        """
+        client = self.get_client(base_url)
+        stats = self._stats[self._key(base_url)]
+        request = client.build_request(method, path, json=json)
+        stats.requests += 1
+        stats.streams += 1
+        stats.active_streams += 1
+        deadline = time.monotonic() + self.first_byte_timeout
+        resp: Optional[httpx.Response] = None
+        try:
+            try:
+                resp = await asyncio.wait_for(
+                    client.send(request, stream=True), self.first_byte_timeout
+                )
+            except asyncio.TimeoutError:
+                raise httpx.ReadTimeout("Timeout esperando primer byte de Ollama", request=request)
+            resp.raise_for_status()
+
+            lines = resp.aiter_lines()
+            timeout = max(deadline - time.monotonic(), 0.0)
+            while True:
+                # asyncio.timeout solo programa un timer (wait_for crearía una Task por línea);
+                # el yield queda fuera del scope para no cancelar al consumidor
+                try:
+                    async with asyncio.timeout(timeout):
+                        line = await lines.__anext__()
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    raise httpx.ReadTimeout("Stream de Ollama inactivo", request=request)
+                timeout = self.stream_idle_timeout
+                if line:
+                    yield line
+        except httpx.TimeoutException:
+            stats.timeouts += 1
+            raise
+        except httpx.HTTPError:
+            stats.errors += 1
+            raise
+        finally:
+            stats.active_streams -= 1
+            if resp is not None:
+                await resp.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        """Estadísticas por backend (contadores + estado de conexiones)"""
+        result: Dict[str, Any] = {}
+        for key, stats in self._stats.items():
+            entry = asdict(stats)
+            client = self._clients.get(key)
+            # httpcore no expone API pública de conexiones; best-effort
+            pool = getattr(getattr(client, "_transport", None), "_pool", None)
+            connections = getattr(pool, "connections", None)
+            if connections is not None:
+                entry["connections"] = len(connections)
+                entry["idle_connections"] = sum(1 for c in connections if c.is_idle())
+            entry["closed"] = client is None or client.is_closed
+            result[key] = entry
+        return result
+
+    async def aclose(self) -> None:
+        """Cierra todos los clientes (shutdown)"""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
+
+
+# Singleton
+_http_pool: Optional[HTTPClientPool] = None
+
+
+def get_http_pool() -> HTTPClientPool:
+    global _http_pool
+    if _http_pool is None:
+        settings = get_settings()
+        _http_pool = HTTPClientPool(
+            max_connections=settings.ollama_pool_max_connections,
+            max_keepalive=settings.ollama_pool_max_keepalive,
+            keepalive_expiry=settings.ollama_pool_keepalive_expiry,
+            connect_timeout=settings.ollama_connect_timeout,
+            first_byte_timeout=settings.ollama_first_byte_timeout,
+            stream_idle_timeout=settings.ollama_stream_idle_timeout,
+        )
+    return _http_pool
+
+
+async def close_http_pool() -> None:
+    global _http_pool
+    if _http_pool is not None:
+        await _http_pool.aclose()
+        _http_pool = None
@@ -0,0 +1,118 @@
+"""
+Cache exacto de respuestas del LLM.
+
+Guarda el stream NDJSON completo devuelto por Ollama, indexado por un hash
+del payload (modelo, system prompt, prompt/mensajes, tools y opciones de
+muestreo). En un hit se re-emiten las mismas líneas, así /chat y el
+frontend no distinguen una respuesta cacheada de una generada.
+Eviction LRU + TTL con presupuesto en bytes.
+"""
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from .config import get_settings
+
+
+@dataclass
+class CacheEntry:
+    lines: List[str]
+    size: int
+    expires_at: float
+
+
+def cache_key(payload: Dict[str, Any]) -> str:
+    """Hash estable del payload enviado a Ollama (sin el flag de stream)"""
+    material = {k: v for k, v in payload.items() if k not in ("stream", "keep_alive")}
+    raw = json.dumps(material, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """LRU con TTL y límite de bytes"""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[List[str]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expires_at < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.lines
+
+    def put(self, key: str, lines: List[str]) -> None:
+        size = sum(len(line.encode("utf-8")) for line in lines)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = CacheEntry(lines=lines, size=size, expires_at=time.monotonic() + self.ttl_seconds)
+        self.total_bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry.size
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.total_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+def is_complete_stream(lines: List[str]) -> bool:
+    """True si la última línea es el chunk final (done) sin error"""
+    if not lines:
+        return False
+    try:
+        last = json.loads(lines[-1])
+    except json.JSONDecodeError:
+        return False
+    return bool(last.get("done")) and "error" not in last
+
+
+# Singleton
+_response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    global _response_cache
+    if _response_cache is None:
+        settings = get_settings()
+        _response_cache = ResponseCache(
+            max_entries=settings.llm_cache_max_entries,
+            max_bytes=settings.llm_cache_max_bytes,
+            ttl_seconds=settings.llm_cache_ttl_seconds,
+        )
+    return _response_cache
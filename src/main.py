@@ -1,11 +1,13 @@
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator, Dict, List, Optional
 from pathlib import Path
+import asyncio
 import json
 import logging
-from fastapi import FastAPI, Depends, HTTPException, status, Request, Response
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Response, Query
 from fastapi.responses import StreamingResponse, JSONResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 import httpx
 from slowapi import Limiter
@@ -13,9 +15,11 @@ from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 
 from .config import get_settings, Settings
-from .db import SessionLocal, engine
+from .db import SessionLocal, engine, session_scope
 from .models import Base, Conversation, Message, SystemPrompt
 from .ollama_client import OllamaClient
+from .context_builder import build_messages, history_budget, load_history, render_transcript, context_key, pack_context, unpack_context
+from .conversation_summary import get_summarizer
 from .deps import get_current_user_hybrid, get_db
 from . import schemas
 from .routes import auth as auth_routes
@@ -26,8 +30,19 @@ from .routes import prompts as prompts_routes
 from .routes import engine as engine_routes
 from .routes import cie10 as cie10_routes
 from .csrf import generate_csrf_token, validate_csrf_token
-from .tools import execute_cie10_tool, get_tool_definitions
+from .tools import (
+    ToolPrefetcher, get_tool_definitions, get_tool_registry, parse_tool_calls, predict_tool_calls, run_tool_calls,
+    tool_round_messages,
+)
 from .hub_reporter import get_hub_reporter
+from .http_pool import get_http_pool, close_http_pool
+from .semantic_cache import close_semantic_cache
+from .model_residency import get_model_residency
+from .cie10_index import get_cie10_index
+from .telemetry import GenerationTrace
+from .scheduler import get_scheduler, QueueFullError, UserQueueLimitError, SchedulerError, Ticket
+from .chat_stream import ChatEvent, MEDIA_TYPES, coalesce_events, resolve_stream_format
+from .stream_registry import ChatStream, get_stream_registry, request_fingerprint, stream_body
 
 # Crear tablas si no existen (para entornos de desarrollo)
 Base.metadata.create_all(bind=engine)
@@ -42,15 +57,39 @@ logging.basicConfig(
         logging.FileHandler(_settings.log_file) if _settings.log_to_file else logging.NullHandler(),
     ],
 )
+logger = logging.getLogger("energyapp.chat")
 app = FastAPI(title="EnergyApp LLM Platform", version="0.2.0")
 
 
+# Tareas de arranque en background (referencia fuerte hasta que terminen)
+_background_tasks: set = set()
+
+
 # Hub Integration - Report app startup
 @app.on_event("startup")
 async def startup_event():
     """Report application startup to Hub"""
     hub = get_hub_reporter()
     hub.report_app_registered(version="0.2.0", env=_settings.env)
+    # Pool HTTP compartido (keep-alive hacia Ollama)
+    get_http_pool().get_client(_settings.ollama_host)
+    # Precarga del modelo y keep-alive periódico según tráfico
+    if _settings.residency_enabled:
+        get_model_residency().start()
+    # Índice CIE-10 en memoria, construido en background
+    if _settings.cie10_service_mode == "local" and _settings.cie10_index_enabled and _settings.cie10_index_preload:
+        task = asyncio.create_task(get_cie10_index().get())
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Cierra las conexiones keep-alive del pool HTTP"""
+    await get_stream_registry().aclose()
+    await get_model_residency().stop()
+    await close_http_pool()
+    await close_semantic_cache()
 
 
 # Rate limiter
@@ -127,36 +166,162 @@ async def health(settings: Settings = Depends(get_settings_dep)):
     return {"status": "ok", "env": settings.env, "model": settings.ollama_model}
 
 
+async def with_queue_events(upstream: AsyncGenerator[str, None], ticket: Ticket) -> AsyncGenerator[Any, None]:
+    """
+    Re-emite las líneas de upstream. Hasta la primera, si la request espera
+    en cola, emite un ChatEvent queued cada vez que cambia su posición.
+    """
+    first = asyncio.ensure_future(upstream.__anext__())
+    last_position = None
+    try:
+        while not first.done():
+            moved = asyncio.ensure_future(ticket.moved.wait())
+            await asyncio.wait({first, moved}, return_when=asyncio.FIRST_COMPLETED)
+            moved.cancel()
+            ticket.moved.clear()
+            if ticket.waiting and ticket.position != last_position and not first.done():
+                last_position = ticket.position
+                yield ChatEvent("queued", {"position": ticket.position})
+    finally:
+        if not first.done():
+            first.cancel()
+            await asyncio.gather(first, return_exceptions=True)
+    try:
+        line = first.result()
+    except StopAsyncIteration:
+        return
+    yield line
+    async for line in upstream:
+        yield line
+
+
 @app.post("/chat", tags=["chat"])
 async def chat(
+    request: Request,
     body: schemas.ChatRequest,
     settings: Settings = Depends(get_settings_dep),
     db: Session = Depends(get_db),
     user=Depends(get_current_user_hybrid),
 ):
-    # Verificar acceso a la conversacion (si se provee conversation_id)
-    if body.conversation_id:
-        conv = (
-            db.query(Conversation)  # type: ignore[attr-defined]
-            .filter(Conversation.id == body.conversation_id, Conversation.user_id == user.id)  # type: ignore[attr-defined]
-            .first()
+    user_id = user.id  # type: ignore[attr-defined]
+    user_role = user.role  # type: ignore[attr-defined]
+    # La sesión de la autenticación no debe retener una conexión del pool
+    # durante todo el stream: el resto del trabajo con DB va en unidades cortas
+    db.close()
+
+    # Reintento con la misma Idempotency-Key: engancharse a la generación original
+    registry = get_stream_registry()
+    idempotency_key = request.headers.get("idempotency-key")
+    fingerprint = None
+    if idempotency_key:
+        if len(idempotency_key) > 255:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Idempotency-Key demasiado larga")
+        fingerprint = request_fingerprint(body.model_dump(exclude={"stream_format"}))
+        previous = registry.lookup_idempotent(user_id, idempotency_key)
+        if previous is not None:
+            if previous.fingerprint != fingerprint:
+                raise HTTPException(
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail="Idempotency-Key ya usada con otro contenido",
+                )
+            original = registry.get(previous.stream_id)
+            if original is None:
+                # La generación terminó y su buffer ya expiró: la respuesta está en la conversación
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="La solicitud ya fue procesada",
+                    headers={"X-Conversation-Id": str(previous.conversation_id)},
+                )
+            registry.idempotent_replays += 1
+            stream_format = resolve_stream_format(body.stream_format, request.headers.get("accept"))
+            return stream_response(request, original, 0, stream_format, {"Idempotent-Replayed": "true"})
+
+    # Control de admisión: reservar lugar en la cola antes de escribir nada en DB
+    try:
+        ticket = get_scheduler().reserve(settings.ollama_model, user_id=user_id, role=user_role)
+    except UserQueueLimitError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Tienes demasiadas respuestas en curso, espera a que terminen",
+            headers={"Retry-After": str(exc.retry_after)},
         )
-        if not conv:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversation not found")
-    else:
-        conv = Conversation(user_id=user.id, title="Nueva conversacion", status="open")  # type: ignore[attr-defined]
-        db.add(conv)
-        db.commit()
-        db.refresh(conv)
-    conv_id = conv.id  # type: ignore[attr-defined]
-
-    # Guardar mensaje del usuario
-    user_msg = Message(  # type: ignore[attr-defined]
-        conversation_id=conv.id, role="user", content=body.prompt
-    )
-    db.add(user_msg)
-    db.commit()
-    db.refresh(user_msg)
+    except QueueFullError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servidor ocupado, intenta nuevamente en unos segundos",
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+
+    # Unidad 1: resolver la conversación, guardar el mensaje del usuario y el system prompt
+    with session_scope() as session:
+        # Verificar acceso a la conversacion (si se provee conversation_id)
+        if body.conversation_id:
+            conv = (
+                session.query(Conversation)  # type: ignore[attr-defined]
+                .filter(Conversation.id == body.conversation_id, Conversation.user_id == user_id)  # type: ignore[attr-defined]
+                .first()
+            )
+            if not conv:
+                get_scheduler().cancel(ticket)
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversation not found")
+        else:
+            conv = Conversation(user_id=user_id, title="Nueva conversacion", status="open")  # type: ignore[attr-defined]
+            session.add(conv)
+            session.flush()
+        conv_id = conv.id  # type: ignore[attr-defined]
+
+        # Guardar mensaje del usuario
+        user_msg = Message(conversation_id=conv_id, role="user", content=body.prompt)  # type: ignore[attr-defined]
+        session.add(user_msg)
+        session.flush()
+
+        # Resolver el system prompt (desde prompt_id si se proporciona, sino usar el parámetro system)
+        system_prompt = body.system or "Eres un asistente útil."
+        if body.prompt_id:
+            prompt_obj = session.query(SystemPrompt).filter(SystemPrompt.id == body.prompt_id).first()  # type: ignore[attr-defined]
+            if prompt_obj:
+                system_prompt = prompt_obj.content  # type: ignore[attr-defined]
+
+        # Obtener definiciones de tools para Tool Calling
+        tools = get_tool_definitions() if settings.chat_tools_enabled else None
+
+        # Sin tools se usa /api/generate: su context del turno anterior evita
+        # re-evaluar el historial si sigue vigente (mismo modelo/system, sin turnos nuevos)
+        reuse_context = not tools and settings.ollama_context_reuse
+        ctx_key = context_key(settings.ollama_model, system_prompt)
+        llm_context = None
+        if reuse_context and conv.llm_context and conv.llm_context_key == ctx_key:  # type: ignore[attr-defined]
+            last_id = (
+                session.query(func.max(Message.id))  # type: ignore[attr-defined]
+                .filter(Message.conversation_id == conv_id, Message.id < user_msg.id)  # type: ignore[attr-defined]
+                .scalar()
+            )
+            if last_id == conv.llm_context_message_id:  # type: ignore[attr-defined]
+                llm_context = unpack_context(conv.llm_context)  # type: ignore[attr-defined]
+
+        # Historial previo que cabe en la ventana de contexto (solo las filas más nuevas);
+        # lo anterior a la marca de agua viaja condensado en el resumen
+        history = []
+        summary = conv.summary  # type: ignore[attr-defined]
+        if body.conversation_id and llm_context is None:
+            budget = history_budget(settings, system_prompt, body.prompt, tools, summary)
+            history = load_history(
+                session, conv_id, budget,
+                before_id=user_msg.id,  # type: ignore[attr-defined]
+                after_id=conv.summary_message_id,  # type: ignore[attr-defined]
+            )
+
+    model_prompt = body.prompt
+    # Turno sin conversación previa: solo entonces aplica el cache semántico
+    # (history/summary se vacían abajo aunque el turno dependa de ellos)
+    standalone_turn = not (history or summary or llm_context)
+    if llm_context is not None:
+        history, summary = [], None
+    elif reuse_context and (history or summary):
+        # Sin context vigente: el historial va aplanado en el prompt para que
+        # /api/generate devuelva un context reutilizable en el próximo turno
+        model_prompt = render_transcript(history, body.prompt, summary)
+        history, summary = [], None
 
     # Report user message to Hub
     hub = get_hub_reporter()
@@ -164,83 +329,132 @@ async def chat(
         action="message_sent",
         role="user",
         conversation_id=conv_id,
-        user_id=user.id,  # type: ignore[attr-defined]
+        user_id=user_id,
         message_length=len(body.prompt)
     )
 
-    # Resolver el system prompt (desde prompt_id si se proporciona, sino usar el parámetro system)
-    system_prompt = body.system or "Eres un asistente útil."
-    if body.prompt_id:
-        prompt_obj = db.query(SystemPrompt).filter(SystemPrompt.id == body.prompt_id).first()  # type: ignore[attr-defined]
-        if prompt_obj:
-            system_prompt = prompt_obj.content  # type: ignore[attr-defined]
-
-    client = OllamaClient(base_url=settings.ollama_host, model=settings.ollama_model)
-
-    # Obtener definiciones de tools para Tool Calling
-    tools = get_tool_definitions()
-
-    async def streamer():
-        assistant_content = ""
+    client = OllamaClient(model=settings.ollama_model)
+
+    trace = GenerationTrace(model=settings.ollama_model)
+    chat_stream = registry.create(user_id, conv_id)
+    if idempotency_key and fingerprint:
+        registry.remember_idempotent(user_id, idempotency_key, fingerprint, chat_stream)
+
+    def count_frame() -> None:
+        trace.token_frames += 1
+
+    async def chat_events() -> AsyncGenerator[ChatEvent, None]:
+        # Partes de la respuesta; se unen una sola vez al persistir
+        assistant_parts: List[str] = []
+        finish_reason = None
+        error_event = None
+        message_id = None
+        new_context = None
+        yield ChatEvent("conversation_id", {"conversation_id": conv_id, "stream_id": chat_stream.id})
+        # Búsquedas probables según el prompt, en paralelo con la primera ronda
+        prefetcher = None
+        if tools and settings.chat_tool_prefetch and settings.chat_max_tool_rounds > 0:
+            predicted = predict_tool_calls(body.prompt, settings.chat_tool_prefetch_max)
+            if predicted:
+                prefetcher = ToolPrefetcher(predicted)
+                trace.tool_prefetched = prefetcher.started
         try:
-            # Primera generación con tools disponibles
-            async for token in client.generate(
-                prompt=body.prompt,
-                system=system_prompt,
-                stream=True,
-                tools=tools
-            ):
+            # La generación corre en la task del stream, desacoplada de la respuesta HTTP.
+            # Cada ronda con tool calls ejecuta todas las tools en paralelo y devuelve
+            # los resultados al modelo (role=tool); la última ronda va sin tools
+            messages: Optional[List[Dict[str, Any]]] = None
+            for round_no in range(settings.chat_max_tool_rounds + 1):
+                round_tools = tools if round_no < settings.chat_max_tool_rounds else None
+                round_parts: List[str] = []
+                raw_calls: List[Dict[str, Any]] = []
+                upstream = client.generate(
+                    prompt=model_prompt,
+                    system=system_prompt,
+                    stream=True,
+                    tools=round_tools,
+                    affinity_key=str(conv_id),
+                    use_cache=body.use_cache,
+                    ticket=ticket,
+                    history=history,
+                    summary=summary,
+                    context=llm_context,
+                    trace=trace,
+                    messages=messages,
+                    semantic_ok=standalone_turn,
+                )
                 try:
-                    data = json.loads(token)
-
-                    # Verificar si hay tool call
-                    # En /api/chat, tool_calls viene dentro de message
-                    tool_calls = None
-                    if "message" in data and "tool_calls" in data["message"]:
-                        tool_calls = data["message"]["tool_calls"]
-                    elif "tool_calls" in data:
-                        tool_calls = data["tool_calls"]
-
-                    if tool_calls:
-                        for tool_call in tool_calls:
-                            tool_name = tool_call.get("function", {}).get("name")
-                            tool_args = tool_call.get("function", {}).get("arguments", {})
-
-                            if isinstance(tool_args, str):
-                                tool_args = json.loads(tool_args)
-
-                            # Ejecutar la herramienta
-                            if tool_name in ["search_cie10", "get_cie10_code"]:
-                                result = await execute_cie10_tool(tool_name, tool_args)
-
-                                # Formatear resultado para el usuario
-                                if result.get("success"):
-                                    formatted = format_cie10_result(result)
-                                    assistant_content += formatted
-                                    yield formatted
-                                else:
-                                    error_msg = f"Error en búsqueda: {result.get('error')}\n"
-                                    assistant_content += error_msg
-                                    yield error_msg
-
-                    # Respuesta normal (texto)
-                    # /api/chat usa message.content, /api/generate usa response
-                    chunk = ""
-                    if "message" in data:
-                        chunk = data["message"].get("content", "")
-                    else:
-                        chunk = data.get("response", "")
-
-                    if chunk:
-                        assistant_content += chunk
-                        yield chunk
-
-                    if data.get("done"):
-                        break
-
-                except json.JSONDecodeError:
-                    # Si llega basura, se omite
-                    continue
+                    async for token in with_queue_events(upstream, ticket):
+                        if isinstance(token, ChatEvent):
+                            yield token
+                            continue
+                        try:
+                            data = json.loads(token)
+                        except json.JSONDecodeError:
+                            # Si llega basura, se omite
+                            continue
+
+                        # En /api/chat, tool_calls viene dentro de message
+                        if "message" in data and "tool_calls" in data["message"]:
+                            raw_calls.extend(data["message"]["tool_calls"] or [])
+                        elif "tool_calls" in data:
+                            raw_calls.extend(data["tool_calls"] or [])
+
+                        # Respuesta normal (texto)
+                        # /api/chat usa message.content, /api/generate usa response
+                        if "message" in data:
+                            chunk = data["message"].get("content", "")
+                        else:
+                            chunk = data.get("response", "")
+
+                        if chunk:
+                            round_parts.append(chunk)
+                            assistant_parts.append(chunk)
+                            trace.token_chunks += 1
+                            trace.mark_first_token()
+                            yield ChatEvent("token", {"content": chunk})
+
+                        if data.get("done"):
+                            new_context = data.get("context")
+                            trace.observe_final(data)
+                            break
+                finally:
+                    await upstream.aclose()
+
+                if not raw_calls or not round_tools:
+                    break
+
+                calls = parse_tool_calls(raw_calls)
+                trace.tool_calls += len(calls)
+                trace.tool_rounds += 1
+                for call in calls:
+                    yield ChatEvent("tool_call", {"name": call.name, "arguments": call.arguments})
+                results = await run_tool_calls(calls, prefetcher)
+                for call, result in zip(calls, results):
+                    trace.mark_first_token()
+                    yield ChatEvent("tool_result", {
+                        "name": call.name,
+                        "success": bool(result.get("success")),
+                        "data": result.get("data"),
+                        "error": result.get("error"),
+                        "text": get_tool_registry().format_result(call.name, result),
+                    })
+
+                if messages is None:
+                    messages = build_messages(system_prompt, history, model_prompt, summary)
+                messages = messages + tool_round_messages("".join(round_parts), raw_calls, calls, results)
+        except asyncio.CancelledError:
+            # Stream abandonado (nadie se re-enganchó a tiempo): se guarda lo generado
+            finish_reason = "client_disconnected"
+            logger.info(f"CHAT_CLIENT_DISCONNECTED | conversation_id={conv_id}, parts={len(assistant_parts)}")
+            raise
+        except SchedulerError as exc:
+            # Timeout esperando en cola: el stream ya empezó, se informa en el stream
+            finish_reason = "queue_timeout"
+            error_event = ChatEvent("error", {
+                "code": "queue_timeout",
+                "message": f"Servidor ocupado ({exc}). Intenta nuevamente en {exc.retry_after} segundos.",
+                "retry_after": exc.retry_after,
+            })
         except httpx.HTTPError as exc:
             # Report LLM error to Hub
             hub.report_error(
@@ -248,18 +462,44 @@ async def chat(
                 message=f"Ollama service unavailable: {str(exc)}",
                 trace=str(exc)
             )
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail=f"Ollama no disponible: {exc}",
-            )
+            finish_reason = "error"
+            error_event = ChatEvent("error", {"code": "ollama_unavailable", "message": f"Ollama no disponible: {exc}"})
         finally:
+            if prefetcher is not None:
+                trace.tool_prefetch_hits = prefetcher.hits
+                prefetcher.cancel()
             # Guardar respuesta del asistente (se ejecuta siempre, incluso si hay errores)
+            assistant_content = "".join(assistant_parts)
             if assistant_content:
-                assistant_msg = Message(  # type: ignore[attr-defined]
-                    conversation_id=conv_id, role="assistant", content=assistant_content
-                )
-                db.add(assistant_msg)
-                db.commit()
+                # Telemetría de la generación (+ motivo si quedó truncada)
+                meta = trace.as_meta()
+                if finish_reason:
+                    meta.update({"truncated": True, "finish_reason": finish_reason})
+                # Unidad 2: se toma una conexión solo para persistir la respuesta
+                with session_scope() as session:
+                    assistant_msg = Message(  # type: ignore[attr-defined]
+                        conversation_id=conv_id,
+                        role="assistant",
+                        content=assistant_content,
+                        meta=json.dumps(meta),
+                    )
+                    session.add(assistant_msg)
+                    session.flush()
+                    message_id = assistant_msg.id  # type: ignore[attr-defined]
+                    if reuse_context:
+                        # Guardar el context nuevo solo si cabe en la ventana; si no
+                        # (o si el turno quedó truncado) se descarta el anterior
+                        keep = new_context and len(new_context) <= settings.ollama_num_ctx - settings.ollama_max_tokens
+                        session.query(Conversation).filter(Conversation.id == conv_id).update({  # type: ignore[attr-defined]
+                            Conversation.llm_context: pack_context(new_context) if keep else None,
+                            Conversation.llm_context_key: ctx_key if keep else None,
+                            Conversation.llm_context_message_id: message_id if keep else None,
+                        })
+
+                # Resumen rodante en background si el historial sin resumir creció
+                summarizer = get_summarizer()
+                if summarizer is not None:
+                    summarizer.schedule(conv_id)
 
                 # Report assistant message to Hub
                 hub.report_interaction(
@@ -269,33 +509,73 @@ async def chat(
                     message_length=len(assistant_content)
                 )
 
-    return StreamingResponse(streamer(), media_type="text/plain")
-
-
-def format_cie10_result(result: dict) -> str:
-    """Formatea los resultados de CIE-10 para presentación al usuario"""
-    if not result.get("success"):
-        return f"\nError: {result.get('error')}\n"
-
-    data = result.get("data", [])
-    if isinstance(data, dict):
-        # Código individual
-        formatted = f"\nCódigo CIE-10: {data.get('code')}\n"
-        formatted += f"Descripción: {data.get('description')}\n"
-        formatted += f"Nivel: {data.get('level')} | Rango: {'Sí' if data.get('is_range') else 'No'}\n"
-        if data.get('parent_code'):
-            formatted += f"Código padre: {data.get('parent_code')}\n"
-        formatted += "\n"
-        return formatted
-    elif isinstance(data, list):
-        # Lista de códigos
-        formatted = f"\nResultados para '{result.get('query')}':\n\n"
-        for idx, item in enumerate(data[:10], 1):
-            formatted += f"{idx}. {item.get('code')} - {item.get('description')}\n"
-        formatted += "\n"
-        return formatted
-
-    return "\n"
+        if error_event is not None:
+            yield error_event
+        yield ChatEvent("usage", trace.as_meta())
+        yield ChatEvent("done", {
+            "conversation_id": conv_id,
+            "message_id": message_id,
+            "finish_reason": finish_reason or "stop",
+        })
+
+    # La generación sigue aunque el cliente se caiga: se reanuda con GET /chat/streams/{id}
+    chat_stream.start(coalesce_events(
+        chat_events(), settings.stream_coalesce_ms / 1000, settings.stream_coalesce_bytes, count_frame
+    ))
+    stream_format = resolve_stream_format(body.stream_format, request.headers.get("accept"))
+    return stream_response(request, chat_stream, 0, stream_format, {"X-Queue-Position": str(ticket.position)})
+
+
+def stream_response(
+    request: Request, chat_stream: ChatStream, offset: int, stream_format: str, headers: dict
+) -> StreamingResponse:
+    """Respuesta HTTP suscrita a un stream de chat desde offset"""
+    headers = {**headers, "X-Conversation-Id": str(chat_stream.conversation_id), "X-Stream-Id": chat_stream.id}
+    if stream_format == "sse":
+        # Evita que nginx acumule los frames
+        headers.update({"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # En text/plain no hay framing: la posición inicial en cola va en un header
+    return StreamingResponse(
+        stream_body(request, chat_stream, offset, stream_format),
+        media_type=MEDIA_TYPES[stream_format],
+        headers=headers,
+    )
+
+
+@app.get("/chat/streams/{stream_id}", tags=["chat"])
+async def resume_chat_stream(
+    stream_id: str,
+    request: Request,
+    offset: int | None = Query(None, ge=0, description="Primer evento (seq) a recibir"),
+    stream_format: str | None = Query(None, pattern="^(text|sse|ndjson)$"),
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user_hybrid),
+):
+    """
+    Re-engancha a una generación en curso (o recién terminada) desde offset.
+
+    offset es el seq del primer evento a recibir. En text no hay seq: los
+    clientes text reanudan con offset=0 y reciben la respuesta completa.
+    """
+    user_id = user.id  # type: ignore[attr-defined]
+    # Igual que en /chat: la sesión de la autenticación no debe retener una
+    # conexión del pool durante el resto del stream
+    db.close()
+    chat_stream = get_stream_registry().get(stream_id)
+    if chat_stream is None or chat_stream.user_id != user_id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Stream not found")
+    if offset is None:
+        # EventSource reenvía el último id recibido
+        last_event_id = request.headers.get("last-event-id")
+        offset = int(last_event_id) + 1 if last_event_id and last_event_id.isdigit() else 0
+    if offset < chat_stream.first_seq:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail=f"Offset fuera del buffer; primer evento disponible: {chat_stream.first_seq}",
+        )
+    get_stream_registry().resumed += 1
+    stream_format = resolve_stream_format(stream_format, request.headers.get("accept"))
+    return stream_response(request, chat_stream, offset, stream_format, {})
 
 
 @app.get("/", include_in_schema=False)
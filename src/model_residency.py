@@ -0,0 +1,208 @@
+"""
+Residencia de modelos en Ollama (warm-up y keep-alive).
+
+Al arrancar y luego cada residency_interval_seconds se consulta /api/ps en
+cada backend para saber qué modelos están cargados en memoria. El modelo
+configurado (ollama_model) y los modelos con tráfico reciente se
+precargan con un keep_alive largo si no están residentes, así la primera
+request tras un periodo inactivo no paga la carga completa del modelo.
+Las propias generaciones también envían keep_alive para extender la
+residencia mientras haya tráfico.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Set
+
+import httpx
+
+from .config import get_settings
+from .http_pool import get_http_pool
+from .ollama_router import get_ollama_router
+
+logger = logging.getLogger("energyapp.model_residency")
+
+
+@dataclass
+class ModelLoad:
+    """Estado de un modelo en un backend"""
+    resident: bool = False
+    size_vram: int = 0
+    expires_at: Optional[str] = None
+    warmups: int = 0
+    warmup_failures: int = 0
+    last_load_seconds: Optional[float] = None
+    last_warmup_at: Optional[float] = None
+
+
+@dataclass
+class BackendResidency:
+    models: Dict[str, ModelLoad] = field(default_factory=dict)
+    last_poll_at: Optional[float] = None
+    poll_error: Optional[str] = None
+
+
+class ModelResidencyManager:
+    """Mantiene cargados en Ollama los modelos en uso"""
+
+    def __init__(self, interval_seconds: float, traffic_window_seconds: float, keep_alive: str):
+        self.interval_seconds = interval_seconds
+        self.traffic_window_seconds = traffic_window_seconds
+        self.keep_alive = keep_alive
+        self._backends: Dict[str, BackendResidency] = {}
+        self._traffic: Dict[str, Deque[float]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def record_use(self, model: str) -> None:
+        """Registra una generación (mantiene caliente el modelo mientras haya tráfico)"""
+        now = time.monotonic()
+        uses = self._traffic.setdefault(model, deque())
+        uses.append(now)
+        self._expire_traffic(model, now)
+
+    def _expire_traffic(self, model: str, now: float) -> None:
+        uses = self._traffic[model]
+        while uses and uses[0] < now - self.traffic_window_seconds:
+            uses.popleft()
+
+    def hot_models(self) -> Set[str]:
+        """Modelo por defecto + modelos usados dentro de la ventana de tráfico"""
+        now = time.monotonic()
+        models = {get_settings().ollama_model}
+        for model in list(self._traffic):
+            self._expire_traffic(model, now)
+            if self._traffic[model]:
+                models.add(model)
+        return models
+
+    def _state(self, url: str, model: str) -> ModelLoad:
+        return self._backends.setdefault(url, BackendResidency()).models.setdefault(model, ModelLoad())
+
+    async def poll(self, url: str) -> None:
+        """Actualiza los modelos residentes de un backend via /api/ps"""
+        state = self._backends.setdefault(url, BackendResidency())
+        try:
+            resp = await get_http_pool().request(url, "GET", "/api/ps", timeout=5.0)
+            resp.raise_for_status()
+            loaded = {m["name"]: m for m in resp.json().get("models", [])}
+        except (httpx.HTTPError, ValueError, KeyError) as exc:
+            state.poll_error = str(exc) or type(exc).__name__
+            return
+        state.poll_error = None
+        state.last_poll_at = time.time()
+        for name, load in state.models.items():
+            load.resident = name in loaded
+        for name, info in loaded.items():
+            load = self._state(url, name)
+            load.resident = True
+            load.size_vram = info.get("size_vram", 0)
+            load.expires_at = info.get("expires_at")
+
+    async def warm(self, url: str, model: str) -> bool:
+        """Carga el modelo en el backend (request sin prompt) con keep_alive largo"""
+        load = self._state(url, model)
+        started = time.monotonic()
+        try:
+            resp = await get_http_pool().request(
+                url, "POST", "/api/generate",
+                json={"model": model, "keep_alive": self.keep_alive, "stream": False},
+                timeout=get_settings().ollama_first_byte_timeout,
+            )
+            resp.raise_for_status()
+        except httpx.HTTPError as exc:
+            load.warmup_failures += 1
+            logger.warning(f"MODEL_WARMUP_FAILED | url={url}, model={model}, error={exc}")
+            return False
+        load.warmups += 1
+        load.resident = True
+        load.last_warmup_at = time.time()
+        load.last_load_seconds = round(time.monotonic() - started, 3)
+        logger.info(f"MODEL_WARMUP | url={url}, model={model}, seconds={load.last_load_seconds}")
+        return True
+
+    async def tick(self) -> None:
+        """Un ciclo: consultar residencia y precargar lo que falte"""
+        router = get_ollama_router()
+        now = time.monotonic()
+        urls = [b.url for b in router.backends.values() if not b.is_ejected(now)]
+        await asyncio.gather(*(self.poll(url) for url in urls))
+        models = self.hot_models()
+        warmups = [
+            self.warm(url, model)
+            for url in urls
+            if self._backends[url].poll_error is None
+            for model in models
+            if not self._state(url, model).resident
+        ]
+        await asyncio.gather(*warmups)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.tick()
+            except Exception:
+                logger.exception("MODEL_RESIDENCY_TICK_FAILED")
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        backends: List[Dict[str, Any]] = []
+        for url, state in self._backends.items():
+            backends.append({
+                "url": url,
+                "last_poll_at": state.last_poll_at,
+                "poll_error": state.poll_error,
+                "models": {
+                    name: {
+                        "resident": load.resident,
+                        "size_vram": load.size_vram,
+                        "expires_at": load.expires_at,
+                        "warmups": load.warmups,
+                        "warmup_failures": load.warmup_failures,
+                        "last_load_seconds": load.last_load_seconds,
+                        "last_warmup_at": load.last_warmup_at,
+                    }
+                    for name, load in state.models.items()
+                },
+            })
+        traffic = {}
+        for model in list(self._traffic):
+            self._expire_traffic(model, now)
+            traffic[model] = len(self._traffic[model])
+        return {
+            "keep_alive": self.keep_alive,
+            "hot_models": sorted(self.hot_models()),
+            "recent_generations": traffic,
+            "backends": backends,
+        }
+
+
+# Singleton
+_residency: Optional[ModelResidencyManager] = None
+
+
+def get_model_residency() -> ModelResidencyManager:
+    global _residency
+    if _residency is None:
+        settings = get_settings()
+        _residency = ModelResidencyManager(
+            interval_seconds=settings.residency_interval_seconds,
+            traffic_window_seconds=settings.residency_traffic_window_seconds,
+            keep_alive=settings.ollama_keep_alive,
+        )
+    return _residency
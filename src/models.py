@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text, Index
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text, Index, LargeBinary
 from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import relationship, Mapped
 from .db import Base
@@ -30,6 +30,13 @@ class Conversation(Base):
     user_id: Mapped[int] = Column(Integer, ForeignKey("users.id"), nullable=False)
     title: Mapped[str] = Column(String(255), default="Nueva conversacion")
     status: Mapped[str] = Column(String(50), default="open")  # open | closed
+    # Resumen rodante de los turnos hasta summary_message_id (inclusive)
+    summary: Mapped[str | None] = Column(Text, nullable=True)
+    summary_message_id: Mapped[int | None] = Column(Integer, nullable=True)
+    # Context de Ollama (/api/generate) comprimido, válido hasta llm_context_message_id
+    llm_context: Mapped[bytes | None] = Column(LargeBinary, nullable=True)
+    llm_context_key: Mapped[str | None] = Column(String(32), nullable=True)  # modelo + system prompt
+    llm_context_message_id: Mapped[int | None] = Column(Integer, nullable=True)
     created_at: Mapped[datetime] = Column(DateTime, default=datetime.utcnow)
     updated_at: Mapped[datetime] = Column(
         DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
@@ -1,6 +1,33 @@
 from typing import AsyncGenerator, Optional, List, Dict, Any
 import httpx
 from .config import get_settings
+from .http_pool import get_http_pool
+from .ollama_router import get_ollama_router
+from .llm_cache import cache_key, get_response_cache, is_complete_stream
+from .semantic_cache import get_semantic_cache, prompt_signature, scope_key, embed
+from .singleflight import get_single_flight
+from .scheduler import Ticket, get_scheduler
+from .context_builder import build_messages
+from .model_residency import get_model_residency
+from .telemetry import GenerationTrace
+
+
+def _is_final_line(line: str) -> bool:
+    """Chunk final (done) sin error: /chat deja de consumir al recibirlo"""
+    return ('"done":true' in line or '"done": true' in line) and is_complete_stream([line])
+
+
+def _release(ticket: Optional[Ticket]) -> None:
+    """Libera la reserva de cola si no va a ocupar slot (idempotente)"""
+    if ticket is not None:
+        get_scheduler().cancel(ticket)
+
+
+def _is_backend_failure(exc: httpx.HTTPError) -> bool:
+    """Errores atribuibles al backend (red, timeouts, 5xx), no a la request"""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return isinstance(exc, httpx.TransportError)
 
 
 class OllamaClient:
@@ -8,11 +35,14 @@ class OllamaClient:
 
     def __init__(self, base_url: Optional[str] = None, model: Optional[str] = None):
         settings = get_settings()
-        self.base_url = base_url or settings.ollama_host
+        # Sin base_url explicita se enruta entre los backends configurados
+        self.base_url = base_url
         self.model = model or settings.ollama_model
         self.temperature = settings.ollama_temperature
         self.top_p = settings.ollama_top_p
         self.max_tokens = settings.ollama_max_tokens
+        self.num_ctx = settings.ollama_num_ctx
+        self.keep_alive = settings.ollama_keep_alive
 
     async def generate(
         self,
@@ -20,6 +50,15 @@ class OllamaClient:
         system: Optional[str] = None,
         stream: bool = True,
         tools: Optional[List[Dict[str, Any]]] = None,
+        affinity_key: Optional[str] = None,
+        use_cache: bool = True,
+        ticket: Optional[Ticket] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+        summary: Optional[str] = None,
+        context: Optional[List[int]] = None,
+        trace: Optional[GenerationTrace] = None,
+        messages: Optional[List[Dict[str, Any]]] = None,
+        semantic_ok: bool = True,
     ) -> AsyncGenerator[str, None]:
         """
         Genera respuesta con soporte opcional de Tool Calling.
@@ -29,27 +68,40 @@ class OllamaClient:
             system: System prompt
             stream: Si se debe hacer streaming
             tools: Lista de herramientas disponibles (Tool Calling)
+            affinity_key: Clave de afinidad (ej: id de conversación) para
+                repetir backend y aprovechar su cache de prompt
+            use_cache: Si se puede responder/guardar en el cache de respuestas
+            ticket: Reserva de cola obtenida con GenerationScheduler.reserve;
+                se pasa en todas las rondas de tools para que esperen en el
+                flujo del usuario (la reserva se consume en la primera)
+            history: Turnos previos ({role, content}) en orden cronológico,
+                ya recortados al presupuesto de contexto
+            summary: Resumen rodante de los turnos anteriores a history
+            context: Context devuelto por Ollama en el turno anterior
+                (/api/generate); reemplaza a history y summary
+            trace: Telemetría de la generación (backend y origen de cache)
+            messages: Array messages completo (rondas siguientes a un tool
+                call); reemplaza a prompt, history y summary
+            semantic_ok: False si el turno depende de la conversación aunque
+                history/summary vengan vacíos (ej: historial aplanado en prompt)
         """
-        # Si hay tools, usar /api/chat (requerido para tool calling)
-        # Si no hay tools, usar /api/generate (backward compatibility)
-        if tools:
-            # Formato para /api/chat (messages array)
-            messages = []
-            if system:
-                messages.append({"role": "system", "content": system})
-            messages.append({"role": "user", "content": prompt})
-
+        # Si hay tools o historial, usar /api/chat (messages array)
+        # Si no, usar /api/generate (backward compatibility)
+        if messages is not None or (context is None and (tools or history or summary)):
             payload = {
                 "model": self.model,
-                "messages": messages,
+                "messages": messages if messages is not None else build_messages(system, history or [], prompt, summary),
                 "stream": stream,
-                "tools": tools,
                 "options": {
                     "temperature": self.temperature,
                     "top_p": self.top_p,
                     "num_predict": self.max_tokens,
+                    "num_ctx": self.num_ctx,
                 },
+                "keep_alive": self.keep_alive,
             }
+            if tools:
+                payload["tools"] = tools
             endpoint = "/api/chat"
         else:
             # Formato para /api/generate (original)
@@ -61,16 +113,132 @@ class OllamaClient:
                     "temperature": self.temperature,
                     "top_p": self.top_p,
                     "num_predict": self.max_tokens,
+                    "num_ctx": self.num_ctx,
                 },
+                "keep_alive": self.keep_alive,
             }
             if system:
                 payload["system"] = system
+            if context is not None:
+                payload["context"] = context
             endpoint = "/api/generate"
 
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            async with client.stream("POST", f"{self.base_url}{endpoint}", json=payload) as resp:
-                resp.raise_for_status()
-                async for line in resp.aiter_lines():
-                    if not line:
-                        continue
-                    yield line
+        if trace is not None:
+            trace.start_round()
+        try:
+            settings = get_settings()
+            cache = get_response_cache() if (use_cache and settings.llm_cache_enabled) else None
+            key = cache_key(payload) if cache else None
+            if cache and key:
+                cached = cache.get(key)
+                if cached is not None:
+                    _release(ticket)
+                    if trace is not None:
+                        trace.mark_cache("exact")
+                    for line in cached:
+                        yield line
+                    return
+
+            # Cache semántico: prompts parafraseados bajo el mismo system prompt.
+            # Con historial la respuesta depende de turnos previos: no aplica
+            standalone = semantic_ok and not (history or summary or context or messages)
+            semantic = get_semantic_cache() if (use_cache and standalone) else None
+            vector = None
+            scope = scope_key(self.model, system, tools)
+            signature = prompt_signature(prompt)
+            if semantic is not None:
+                vector = await embed(prompt, settings.semantic_cache_embed_model)
+                if vector is not None:
+                    similar = semantic.lookup(vector, scope, signature)
+                    if similar is not None:
+                        _release(ticket)
+                        if trace is not None:
+                            trace.mark_cache("semantic")
+                        for line in similar:
+                            yield line
+                        return
+
+            if use_cache:
+                # Requests idénticas concurrentes comparten un solo stream upstream
+                flight, leader = get_single_flight().join(
+                    key or cache_key(payload), lambda: self._stream(endpoint, payload, affinity_key, ticket, trace)
+                )
+                upstream = flight.subscribe()
+                if not leader:
+                    # El líder ocupa el slot: la reserva del follower se libera ya
+                    _release(ticket)
+                    if trace is not None:
+                        trace.mark_cache("coalesced")
+            else:
+                upstream, leader = self._stream(endpoint, payload, affinity_key, ticket, trace), True
+
+            record = leader and (cache is not None or vector is not None)
+            lines: List[str] = []
+            async for line in upstream:
+                if record:
+                    lines.append(line)
+                    # Solo se cachean generaciones completas (chunk final con done).
+                    # Se guarda antes de re-emitir el chunk final: /chat deja de
+                    # consumir al verlo y el generador se cierra en ese yield
+                    if is_complete_stream(lines):
+                        if cache and key:
+                            cache.put(key, lines)
+                        if semantic is not None and vector is not None:
+                            semantic.store(vector, scope, signature, lines)
+                        record = False
+                yield line
+        finally:
+            # Si no llegó a ocupar slot (error, cliente desconectado) se libera
+            _release(ticket)
+
+    async def _stream(
+        self,
+        endpoint: str,
+        payload: Dict[str, Any],
+        affinity_key: Optional[str],
+        ticket: Optional[Ticket] = None,
+        trace: Optional[GenerationTrace] = None,
+    ) -> AsyncGenerator[str, None]:
+        """Stream NDJSON desde Ollama (backend fijo o via router)"""
+        pool = get_http_pool()
+        get_model_residency().record_use(self.model)
+        if self.base_url:
+            if trace is not None:
+                trace.backend = self.base_url
+            async for line in pool.stream_lines(self.base_url, endpoint, json=payload):
+                yield line
+            return
+
+        router = get_ollama_router()
+        scheduler = get_scheduler()
+        tried: List[str] = []
+        while True:
+            # Espera un slot libre (backend, modelo) según el control de admisión
+            # El ticket se conserva en reintentos: identifica el flujo (usuario/rol) del fair queuing
+            async with scheduler.slot(self.model, affinity_key, exclude=tried, ticket=ticket) as backend:
+                started = False
+                reported = False
+                if trace is not None:
+                    trace.backend = backend.url
+                try:
+                    # Conexión keep-alive compartida (pool por backend)
+                    async for line in pool.stream_lines(backend.url, endpoint, json=payload):
+                        started = True
+                        # El éxito se registra al ver el chunk final, antes de re-emitirlo:
+                        # el consumidor suele cerrar el generador en ese yield
+                        if not reported and _is_final_line(line):
+                            router.report_success(backend)
+                            reported = True
+                        yield line
+                except httpx.HTTPError as exc:
+                    if _is_backend_failure(exc):
+                        router.report_failure(backend)
+                    tried.append(backend.url)
+                    # Reintentar en otro backend solo si aun no se envio nada
+                    retryable = isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout))
+                    if started or not retryable or len(tried) >= len(router.backends):
+                        raise
+                    continue
+                if not reported:
+                    router.report_success(backend)
+                return
@@ -0,0 +1,235 @@
+"""
+Router de backends Ollama.
+
+Reparte cada generación al backend con menos streams en curso
+(least-outstanding-requests ponderado por peso) y saca de rotación,
+de forma pasiva, a los backends que fallan seguido. Pasado el periodo
+de expulsión el backend vuelve a entrar a prueba con una sola request.
+
+Con una clave de afinidad (id de conversación) se usa hashing consistente
+para que los turnos de una misma conversación caigan en el mismo nodo y
+Ollama reutilice su KV cache del prefijo; solo se cambia de nodo si el
+preferido está expulsado o sobrecargado respecto al menos cargado.
+"""
+import bisect
+import hashlib
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .config import Settings, get_settings
+
+logger = logging.getLogger("energyapp.ollama_router")
+
+
+@dataclass
+class OllamaBackend:
+    """Estado de un backend Ollama"""
+    url: str
+    weight: float = 1.0
+    in_flight: int = 0
+    requests: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    ejected_until: float = 0.0
+    ejections: int = 0
+
+    def is_ejected(self, now: float) -> bool:
+        return now < self.ejected_until
+
+    def on_probation(self, now: float) -> bool:
+        """Expulsión vencida pero sin éxito posterior (half-open)"""
+        return self.ejected_until > 0 and now >= self.ejected_until
+
+    def load(self) -> float:
+        return (self.in_flight + 1) / max(self.weight, 0.01)
+
+
+class NoBackendAvailable(Exception):
+    """No hay backends Ollama configurados"""
+
+
+class OllamaRouter:
+    """Selección de backend por menor carga con expulsión pasiva."""
+
+    VNODES = 64  # nodos virtuales por unidad de peso
+
+    def __init__(
+        self,
+        backends: Sequence[Tuple[str, float]],
+        eject_after_failures: int = 3,
+        eject_seconds: float = 30.0,
+        affinity_max_extra: int = 2,
+    ):
+        self.eject_after_failures = eject_after_failures
+        self.eject_seconds = eject_seconds
+        self.affinity_max_extra = affinity_max_extra
+        self.backends: Dict[str, OllamaBackend] = {}
+        self._ring: List[Tuple[int, str]] = []
+        self._ring_keys: List[int] = []
+        self.affinity_hits = 0
+        self.affinity_fallbacks = 0
+        self.configure(backends)
+
+    def configure(self, backends: Sequence[Tuple[str, float]]) -> None:
+        """Actualiza la lista de backends conservando el estado de los existentes"""
+        updated: Dict[str, OllamaBackend] = {}
+        for url, weight in backends:
+            url = url.rstrip("/")
+            backend = self.backends.get(url) or OllamaBackend(url=url)
+            backend.weight = weight
+            updated[url] = backend
+        self.backends = updated
+        self._build_ring()
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        # hash() de Python es aleatorio por proceso; se necesita estable
+        return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+    def _build_ring(self) -> None:
+        """Anillo de hashing consistente con nodos virtuales según peso"""
+        ring = []
+        for backend in self.backends.values():
+            replicas = max(1, int(self.VNODES * backend.weight))
+            for i in range(replicas):
+                ring.append((self._hash(f"{backend.url}#{i}"), backend.url))
+        ring.sort()
+        self._ring = ring
+        self._ring_keys = [h for h, _ in ring]
+
+    def _ring_order(self, key: str) -> List[OllamaBackend]:
+        """Backends en orden de preferencia para la clave (recorriendo el anillo)"""
+        if not self._ring:
+            return []
+        start = bisect.bisect(self._ring_keys, self._hash(key)) % len(self._ring)
+        seen: List[str] = []
+        for offset in range(len(self._ring)):
+            url = self._ring[(start + offset) % len(self._ring)][1]
+            if url not in seen:
+                seen.append(url)
+                if len(seen) == len(self.backends):
+                    break
+        return [self.backends[url] for url in seen]
+
+    def candidates(self, exclude: Sequence[str] = ()) -> List[OllamaBackend]:
+        """Backends elegibles: sanos, o a prueba sin request en curso"""
+        now = time.monotonic()
+        result = []
+        for backend in self.backends.values():
+            if backend.url in exclude or backend.is_ejected(now):
+                continue
+            if backend.on_probation(now) and backend.in_flight > 0:
+                continue
+            result.append(backend)
+        return result
+
+    def eligible(self, exclude: Sequence[str] = ()) -> List[OllamaBackend]:
+        """Candidatos; si todos están expulsados, fail-open hacia el que vuelve primero"""
+        if not self.backends:
+            raise NoBackendAvailable("No hay backends Ollama configurados")
+        candidates = self.candidates(exclude)
+        if candidates:
+            return candidates
+        pool = [b for b in self.backends.values() if b.url not in exclude] or list(self.backends.values())
+        return [min(pool, key=lambda b: b.ejected_until)]
+
+    def choose(self, candidates: Sequence[OllamaBackend], affinity_key: Optional[str] = None) -> OllamaBackend:
+        """
+        Backend con menor (in_flight + 1) / weight.
+
+        Con affinity_key se prefiere el nodo del anillo para esa clave,
+        mientras no supere en más de affinity_max_extra streams al menos
+        cargado; si no, el siguiente del anillo que cumpla (bounded load).
+        """
+        least = min(candidates, key=lambda b: b.load())
+        if affinity_key is None or len(self.backends) == 1:
+            return least
+
+        eligible = {b.url for b in candidates}
+        for rank, backend in enumerate(self._ring_order(affinity_key)):
+            if backend.url not in eligible:
+                continue
+            if backend.in_flight <= least.in_flight + self.affinity_max_extra:
+                if rank == 0:
+                    self.affinity_hits += 1
+                else:
+                    self.affinity_fallbacks += 1
+                return backend
+        self.affinity_fallbacks += 1
+        return least
+
+    def pick(self, exclude: Sequence[str] = (), affinity_key: Optional[str] = None) -> OllamaBackend:
+        return self.choose(self.eligible(exclude), affinity_key)
+
+    def acquire(self, backend: OllamaBackend) -> None:
+        backend.in_flight += 1
+        backend.requests += 1
+
+    def release(self, backend: OllamaBackend) -> None:
+        backend.in_flight -= 1
+
+    def report_success(self, backend: OllamaBackend) -> None:
+        if backend.ejected_until:
+            logger.info(f"OLLAMA_BACKEND_READMITTED | url={backend.url}")
+        backend.consecutive_failures = 0
+        backend.ejected_until = 0.0
+
+    def report_failure(self, backend: OllamaBackend) -> None:
+        backend.failures += 1
+        backend.consecutive_failures += 1
+        now = time.monotonic()
+        if backend.on_probation(now) or backend.consecutive_failures >= self.eject_after_failures:
+            backend.ejected_until = now + self.eject_seconds
+            backend.ejections += 1
+            logger.warning(
+                f"OLLAMA_BACKEND_EJECTED | url={backend.url}, "
+                f"consecutive_failures={backend.consecutive_failures}, seconds={self.eject_seconds}"
+            )
+
+    def affinity_stats(self) -> dict:
+        return {"hits": self.affinity_hits, "fallbacks": self.affinity_fallbacks}
+
+    def stats(self) -> List[dict]:
+        now = time.monotonic()
+        return [
+            {
+                "url": b.url,
+                "weight": b.weight,
+                "in_flight": b.in_flight,
+                "requests": b.requests,
+                "failures": b.failures,
+                "ejections": b.ejections,
+                "status": "ejected" if b.is_ejected(now) else ("probation" if b.on_probation(now) else "healthy"),
+            }
+            for b in self.backends.values()
+        ]
+
+
+def configured_backends(settings: Settings) -> List[Tuple[str, float]]:
+    """Backends desde settings; si no hay lista, se usa ollama_host"""
+    if settings.ollama_backends:
+        return [(b.url, b.weight) for b in settings.ollama_backends]
+    return [(settings.ollama_host, 1.0)]
+
+
+# Singleton
+_router: Optional[OllamaRouter] = None
+
+
+def get_ollama_router() -> OllamaRouter:
+    global _router
+    settings = get_settings()
+    backends = configured_backends(settings)
+    if _router is None:
+        _router = OllamaRouter(
+            backends,
+            eject_after_failures=settings.ollama_eject_after_failures,
+            eject_seconds=settings.ollama_eject_seconds,
+            affinity_max_extra=settings.ollama_affinity_max_extra_inflight,
+        )
+    elif [(url.rstrip("/"), w) for url, w in backends] != [(b.url, b.weight) for b in _router.backends.values()]:
+        # ollama_host puede cambiar en caliente via /config/set
+        _router.configure(backends)
+    return _router
@@ -1,12 +1,26 @@
 ﻿from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from datetime import datetime
+import json
+from datetime import datetime, timedelta
 from passlib.context import CryptContext
 from .. import schemas
 from ..deps import get_db, require_admin_or_supervisor, require_admin_or_supervisor_hybrid, get_client_ip
 from ..models import User, Conversation, Message, UserCreationLog
 from ..audit import AuditLogger, AuditAction
+from ..scheduler import get_scheduler
+from ..http_pool import get_http_pool
+from ..ollama_router import get_ollama_router
+from ..llm_cache import get_response_cache
+from ..semantic_cache import get_semantic_cache
+from ..singleflight import get_single_flight
+from ..conversation_summary import get_summarizer
+from ..model_residency import get_model_residency
+from ..stream_registry import get_stream_registry
+from ..tools import get_tool_registry
+from .engine import ollama_backends_health
+from ..telemetry import aggregate
+from ..cie10_index import get_cie10_index
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -323,3 +337,80 @@ def get_audit_logs(
     )
 
     return logs
+
+
+@router.get("/scheduler")
+def get_scheduler_stats(
+    admin: User = Depends(require_admin_or_supervisor_hybrid),
+):
+    """Estado de la cola de generación y tiempos de espera por usuario/rol"""
+    scheduler = get_scheduler()
+    return {
+        "role_weights": scheduler.role_weights,
+        "queue": scheduler.stats(),
+        "wait_by_user": scheduler.wait_stats_by_user(),
+    }
+
+
+@router.get("/engine")
+async def get_engine_internals(
+    admin: User = Depends(require_admin_or_supervisor_hybrid),
+):
+    """
+    Estado interno del motor (no expuesto en /engine/status, que es público):
+    backends de Ollama, pool HTTP, caches, scheduler, residencia de modelos,
+    streams de /chat y tools
+    """
+    semantic = get_semantic_cache()
+    summarizer = get_summarizer()
+    return {
+        "ollama_backends": await ollama_backends_health(),
+        "ollama_affinity": get_ollama_router().affinity_stats(),
+        "http_pool": get_http_pool().stats(),
+        "llm_cache": get_response_cache().stats(),
+        "semantic_cache": semantic.stats() if semantic else None,
+        "single_flight": get_single_flight().stats(),
+        "scheduler": get_scheduler().stats(),
+        "summaries": summarizer.stats() if summarizer else None,
+        "model_residency": get_model_residency().stats(),
+        "chat_streams": get_stream_registry().stats(),
+        "tools": get_tool_registry().stats(),
+    }
+
+
+@router.post("/cie10/reindex")
+async def reindex_cie10(
+    admin: User = Depends(require_admin_or_supervisor_hybrid),
+):
+    """Reconstruye el índice CIE-10 en memoria (tras recargar la tabla con scripts/load_cie10.py)"""
+    holder = get_cie10_index()
+    holder.invalidate()
+    return (await holder.get()).stats()
+
+
+@router.get("/llm-metrics")
+def get_llm_metrics(
+    days: int = Query(7, ge=1, le=90),
+    model: str | None = Query(None, description="Filter by model"),
+    db: Session = Depends(get_db),
+    admin: User = Depends(require_admin_or_supervisor_hybrid),
+):
+    """Percentiles (p50/p95/p99) de TTFT, latencia, tokens/s y tokens de prompt por modelo y día"""
+    since = datetime.utcnow() - timedelta(days=days)
+    rows = (
+        db.query(Message.created_at, Message.meta)  # type: ignore[attr-defined]
+        .filter(Message.role == "assistant", Message.meta.isnot(None), Message.created_at >= since)  # type: ignore[attr-defined]
+        .yield_per(1000)
+    )
+
+    def parsed():
+        for created_at, raw in rows:
+            try:
+                meta = json.loads(raw)
+            except ValueError:
+                continue
+            if not isinstance(meta, dict) or (model and meta.get("model") != model):
+                continue
+            yield created_at.date().isoformat(), meta
+
+    return {"since": since.isoformat(), "metrics": aggregate(parsed())}
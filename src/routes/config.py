@@ -4,6 +4,7 @@ import httpx
 
 from .. import schemas
 from ..config import get_settings, Settings
+from ..http_pool import get_http_pool
 from ..deps import get_current_user, get_db
 from ..models import User
 
@@ -55,11 +56,9 @@ async def test_ollama(
     settings: Settings = Depends(get_settings),  # noqa: B008
     user: User = Depends(get_current_user),  # noqa: B008
 ):
-    url = settings.ollama_host.rstrip("/") + "/api/tags"
     try:
-        async with httpx.AsyncClient(timeout=5) as client:
-            resp = await client.get(url)
-            resp.raise_for_status()
+        resp = await get_http_pool().request(settings.ollama_host, "GET", "/api/tags", timeout=5)
+        resp.raise_for_status()
         return {"ok": True}
     except httpx.HTTPError as exc:
         raise HTTPException(
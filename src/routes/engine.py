@@ -1,10 +1,13 @@
 """
 Engine monitoring endpoints for system health and Ollama status
 """
+import asyncio
+from typing import List
 from fastapi import APIRouter, Depends
 import psutil
-import httpx
 from ..config import Settings, get_settings
+from ..http_pool import get_http_pool
+from ..ollama_router import get_ollama_router
 
 router = APIRouter(prefix="/engine", tags=["engine"])
 
@@ -12,21 +15,32 @@ router = APIRouter(prefix="/engine", tags=["engine"])
 async def check_ollama_health(ollama_host: str) -> bool:
     """Check if Ollama is responding to health checks"""
     try:
-        async with httpx.AsyncClient(timeout=2.0) as client:
-            response = await client.get(f"{ollama_host}/api/tags")
-            return response.status_code == 200
+        response = await get_http_pool().request(ollama_host, "GET", "/api/tags", timeout=2.0)
+        return response.status_code == 200
     except Exception:
         return False
 
 
+async def ollama_backends_health() -> List[dict]:
+    """Estado de cada backend del router + si responde a /api/tags"""
+    backends = get_ollama_router().stats()
+    checks = await asyncio.gather(*(check_ollama_health(b["url"]) for b in backends))
+    for backend, reachable in zip(backends, checks):
+        backend["reachable"] = reachable
+    return backends
+
+
 @router.get("/status")
 async def get_engine_status(settings: Settings = Depends(get_settings)):
     """
     Get current engine status including:
     - CPU usage percentage
     - Memory usage (used, total, free in GB)
-    - Ollama health status
+    - Ollama health status (healthy if any backend responds)
     - Overall engine status (ok, warning, critical, offline)
+
+    Public endpoint (polled by EngineStatusBar): backend URLs and internal
+    stats are only exposed to admins under /admin/engine.
     """
     # Get CPU and memory metrics with highest precision for real-time monitoring
     cpu_percent = psutil.cpu_percent(interval=0.05)
@@ -37,8 +51,9 @@ async def get_engine_status(settings: Settings = Depends(get_settings)):
     memory_total_gb = memory.total / (1024 ** 3)
     memory_free_gb = memory.available / (1024 ** 3)
 
-    # Check Ollama health
-    ollama_healthy = await check_ollama_health(settings.ollama_host)
+    # Check Ollama health (sano si al menos un backend responde)
+    backends = await ollama_backends_health()
+    ollama_healthy = any(b["reachable"] for b in backends)
     ollama_status = "healthy" if ollama_healthy else "unhealthy"
 
     # Determine overall engine status based on metrics
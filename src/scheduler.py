@@ -0,0 +1,359 @@
+"""
+Control de admisión para generaciones en Ollama.
+
+Cada par (backend, modelo) admite un número limitado de generaciones
+simultáneas; el resto espera en una cola acotada dentro de la app en vez
+de encolarse dentro de Ollama (donde todas se degradan a la vez).
+
+Flujo:
+1. /chat reserva un ticket antes de abrir el stream (reserve). Si la cola
+   está llena se rechaza con 503 + Retry-After.
+2. Cuando la generación realmente va a Ollama, slot() consume el ticket
+   y espera un backend con capacidad. Si la respuesta sale de cache o de
+   una generación compartida, el ticket se libera sin ocupar slot.
+
+La cola no es FIFO sino weighted fair queuing por usuario: cada usuario
+es un flujo con peso según su rol, y los waiters se despachan por menor
+finish tag virtual (S = max(V, F_usuario); F = S + 1/peso). Un usuario
+que dispara muchos prompts solo avanza en su propio flujo y no deja sin
+turno al resto; los roles con más peso obtienen una fracción mayor.
+"""
+import asyncio
+import itertools
+import logging
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from .config import get_settings
+from .ollama_router import OllamaBackend, OllamaRouter, get_ollama_router
+
+logger = logging.getLogger("energyapp.scheduler")
+
+# Reservas que nunca llegan a usarse (cliente que no lee el stream) expiran
+RESERVATION_TTL = 30.0
+
+
+class SchedulerError(Exception):
+    """Error base de admisión"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QueueFullError(SchedulerError):
+    """La cola de espera está llena"""
+
+
+class UserQueueLimitError(QueueFullError):
+    """El usuario ya tiene demasiadas generaciones pendientes"""
+
+
+class QueueTimeoutError(SchedulerError):
+    """Se agotó el tiempo de espera en cola"""
+
+
+@dataclass
+class Ticket:
+    """Reserva de lugar en la cola para una request; también identifica su flujo (usuario/rol)"""
+    id: int
+    model: str
+    user_id: Optional[int] = None
+    role: Optional[str] = None
+    created_at: float = field(default_factory=time.monotonic)
+    position: int = 0
+    released: bool = False
+    waiting: bool = False  # esperando slot en la cola (no solo reservado)
+    moved: asyncio.Event = field(default_factory=asyncio.Event)  # cambió waiting o position
+
+
+@dataclass
+class _Waiter:
+    model: str
+    affinity_key: Optional[str]
+    exclude: Sequence[str]
+    future: "asyncio.Future[OllamaBackend]"
+    ticket: Optional[Ticket]
+    flow: str
+    finish_tag: float
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class WaitStats:
+    """Tiempos de espera en cola de un flujo (usuario o rol)"""
+    count: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    def record(self, seconds: float) -> None:
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "avg_seconds": round(self.total_seconds / self.count, 3) if self.count else 0.0,
+            "max_seconds": round(self.max_seconds, 3),
+        }
+
+
+class GenerationScheduler:
+    """Slots por (backend, modelo) + cola acotada con fair queuing"""
+
+    def __init__(
+        self,
+        router: OllamaRouter,
+        max_concurrency: int,
+        model_concurrency: Dict[str, int],
+        max_queue: int,
+        queue_timeout: float,
+        role_weights: Optional[Dict[str, float]] = None,
+        max_pending_per_user: int = 5,
+    ):
+        self.router = router
+        self.max_concurrency = max_concurrency
+        self.model_concurrency = model_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.role_weights = role_weights or {}
+        self.max_pending_per_user = max_pending_per_user
+        self._virtual_time = 0.0
+        self._flow_finish: Dict[str, float] = defaultdict(float)
+        self._wait_by_user: Dict[str, WaitStats] = defaultdict(WaitStats)
+        self._wait_by_role: Dict[str, WaitStats] = defaultdict(WaitStats)
+        self._running: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._reserved: Dict[int, Ticket] = {}
+        self._waiters: List[_Waiter] = []
+        self._ids = itertools.count(1)
+        self._avg_duration = 10.0  # EWMA de segundos por generación
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def limit(self, model: str) -> int:
+        return self.model_concurrency.get(model, self.max_concurrency)
+
+    def _usable(self, model: str, exclude: Sequence[str] = ()) -> List[OllamaBackend]:
+        limit = self.limit(model)
+        return [
+            b for b in self.router.eligible(exclude)
+            if self._running[(b.url, model)] < limit
+        ]
+
+    def _free_slots(self, model: str) -> int:
+        limit = self.limit(model)
+        return sum(max(limit - self._running[(b.url, model)], 0) for b in self.router.eligible())
+
+    def _pending_reservations(self, model: str) -> int:
+        now = time.monotonic()
+        for ticket_id, ticket in list(self._reserved.items()):
+            if now - ticket.created_at > RESERVATION_TTL:
+                del self._reserved[ticket_id]
+        return sum(1 for t in self._reserved.values() if t.model == model)
+
+    def _waiting(self, model: str) -> int:
+        return sum(1 for w in self._waiters if w.model == model)
+
+    def retry_after(self, model: str) -> int:
+        """Estimación de segundos hasta que haya lugar"""
+        slots = max(self.limit(model) * len(self.router.backends), 1)
+        backlog = self._waiting(model) + self._pending_reservations(model)
+        return max(1, int(self._avg_duration * (backlog / slots + 1)))
+
+    def _pending_for_user(self, user_id: int) -> int:
+        reserved = sum(1 for t in self._reserved.values() if t.user_id == user_id)
+        waiting = sum(1 for w in self._waiters if w.ticket is not None and w.ticket.user_id == user_id)
+        return reserved + waiting
+
+    def reserve(self, model: str, user_id: Optional[int] = None, role: Optional[str] = None) -> Ticket:
+        """Reserva lugar en la cola o levanta QueueFullError"""
+        if user_id is not None and self._pending_for_user(user_id) >= self.max_pending_per_user:
+            self.rejected += 1
+            logger.warning(f"QUEUE_USER_LIMIT | user_id={user_id}, model={model}")
+            raise UserQueueLimitError("Demasiadas generaciones pendientes", self.retry_after(model))
+        pending = self._waiting(model) + self._pending_reservations(model)
+        position = pending - self._free_slots(model) + 1
+        if position > self.max_queue:
+            self.rejected += 1
+            logger.warning(f"QUEUE_FULL | model={model}, pending={pending}")
+            raise QueueFullError("Cola de generación llena", self.retry_after(model))
+        ticket = Ticket(id=next(self._ids), model=model, user_id=user_id, role=role, position=max(position, 0))
+        self._reserved[ticket.id] = ticket
+        return ticket
+
+    def cancel(self, ticket: Ticket) -> None:
+        """Libera una reserva que no llegó a usarse (ej: hit de cache)"""
+        ticket.released = True
+        self._reserved.pop(ticket.id, None)
+
+    def _take(self, backend: OllamaBackend, model: str) -> None:
+        self._running[(backend.url, model)] += 1
+        self.router.acquire(backend)
+        self.admitted += 1
+
+    def _give_back(self, backend: OllamaBackend, model: str, duration: float) -> None:
+        self._running[(backend.url, model)] -= 1
+        self.router.release(backend)
+        self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+
+    def weight(self, role: Optional[str]) -> float:
+        return max(self.role_weights.get(role or "", 1.0), 0.01)
+
+    def _finish_tag(self, flow: str, role: Optional[str]) -> float:
+        """Finish tag virtual del próximo pedido del flujo (costo 1)"""
+        start = max(self._virtual_time, self._flow_finish[flow])
+        finish = start + 1.0 / self.weight(role)
+        self._flow_finish[flow] = finish
+        return finish
+
+    def _next_waiters(self) -> List[_Waiter]:
+        """Orden de despacho: menor finish tag primero (estable)"""
+        return sorted(self._waiters, key=lambda w: w.finish_tag)
+
+    def _record_wait(self, ticket: Optional[Ticket], seconds: float) -> None:
+        user = str(ticket.user_id) if ticket and ticket.user_id is not None else "system"
+        role = (ticket.role if ticket else None) or "system"
+        self._wait_by_user[user].record(seconds)
+        self._wait_by_role[role].record(seconds)
+
+    def _dispatch(self) -> None:
+        """Asigna slots libres a los waiters en orden"""
+        for waiter in self._next_waiters():
+            if waiter.future.done():
+                self._waiters.remove(waiter)
+                continue
+            usable = self._usable(waiter.model, waiter.exclude)
+            if not usable:
+                continue
+            backend = self.router.choose(usable, waiter.affinity_key)
+            self._waiters.remove(waiter)
+            self._take(backend, waiter.model)
+            self._virtual_time = max(self._virtual_time, waiter.finish_tag)
+            self._stop_waiting(waiter)
+            waiter.future.set_result(backend)
+        self._update_positions()
+
+    def _update_positions(self) -> None:
+        positions: Dict[str, int] = defaultdict(int)
+        for waiter in self._next_waiters():
+            positions[waiter.model] += 1
+            if waiter.ticket is not None and waiter.ticket.position != positions[waiter.model]:
+                waiter.ticket.position = positions[waiter.model]
+                waiter.ticket.moved.set()
+
+    @staticmethod
+    def _stop_waiting(waiter: _Waiter) -> None:
+        if waiter.ticket is not None:
+            waiter.ticket.waiting = False
+            waiter.ticket.moved.set()
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        model: str,
+        affinity_key: Optional[str] = None,
+        exclude: Sequence[str] = (),
+        ticket: Optional[Ticket] = None,
+    ) -> AsyncIterator[OllamaBackend]:
+        """Espera un backend con capacidad para el modelo y lo retiene"""
+        if ticket is not None:
+            # La reserva pasa a ser una espera real (o un slot)
+            self.cancel(ticket)
+
+        backend: Optional[OllamaBackend] = None
+        flow = f"user:{ticket.user_id}" if ticket and ticket.user_id is not None else "system"
+        role = ticket.role if ticket else None
+        enqueued_at = time.monotonic()
+        usable = self._usable(model, exclude)
+        if usable and not self._waiting(model):
+            backend = self.router.choose(usable, affinity_key)
+            self._take(backend, model)
+            # Servicio inmediato: el flujo consume su turno igual
+            self._virtual_time = max(self._virtual_time, self._finish_tag(flow, role))
+        else:
+            waiter = _Waiter(
+                model=model,
+                affinity_key=affinity_key,
+                exclude=exclude,
+                future=asyncio.get_running_loop().create_future(),
+                ticket=ticket,
+                flow=flow,
+                finish_tag=self._finish_tag(flow, role),
+            )
+            self._waiters.append(waiter)
+            if ticket is not None:
+                ticket.waiting = True
+                ticket.moved.set()
+            self._update_positions()
+            try:
+                backend = await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+                self._stop_waiting(waiter)
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    self._update_positions()
+                if waiter.future.done() and not waiter.future.cancelled():
+                    # El slot se asignó justo al cancelar: devolverlo
+                    self._give_back(waiter.future.result(), model, 0.0)
+                    self._dispatch()
+                else:
+                    waiter.future.cancel()
+                if isinstance(exc, asyncio.TimeoutError):
+                    self.timeouts += 1
+                    raise QueueTimeoutError("Tiempo de espera en cola agotado", self.retry_after(model))
+                raise
+
+        self._record_wait(ticket, time.monotonic() - enqueued_at)
+        started = time.monotonic()
+        try:
+            yield backend
+        finally:
+            self._give_back(backend, model, time.monotonic() - started)
+            self._dispatch()
+
+    def stats(self) -> Dict[str, object]:
+        running: Dict[str, Dict[str, int]] = defaultdict(dict)
+        for (url, model), count in self._running.items():
+            if count:
+                running[url][model] = count
+        return {
+            "running": dict(running),
+            "waiting": len(self._waiters),
+            "reserved": len(self._reserved),
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "avg_generation_seconds": round(self._avg_duration, 2),
+            "wait_by_role": {role: w.as_dict() for role, w in self._wait_by_role.items()},
+        }
+
+    def wait_stats_by_user(self) -> Dict[str, Dict[str, float]]:
+        """Tiempos de espera por usuario (para ajustar los pesos)"""
+        return {user: w.as_dict() for user, w in self._wait_by_user.items()}
+
+
+# Singleton
+_scheduler: Optional[GenerationScheduler] = None
+
+
+def get_scheduler() -> GenerationScheduler:
+    global _scheduler
+    router = get_ollama_router()  # sincroniza backends si cambió la config
+    if _scheduler is None:
+        settings = get_settings()
+        _scheduler = GenerationScheduler(
+            router,
+            max_concurrency=settings.ollama_max_concurrency,
+            model_concurrency=settings.ollama_model_concurrency,
+            max_queue=settings.ollama_queue_max,
+            queue_timeout=settings.ollama_queue_timeout,
+            role_weights=settings.scheduler_role_weights,
+            max_pending_per_user=settings.scheduler_max_pending_per_user,
+        )
+    return _scheduler
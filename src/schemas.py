@@ -1,5 +1,5 @@
 ﻿from datetime import datetime
-from typing import Optional
+from typing import Literal, Optional
 from pydantic import BaseModel, EmailStr, Field
 
 
@@ -64,6 +64,9 @@ class ChatRequest(BaseModel):
     system: Optional[str] = None
     conversation_id: Optional[int] = None
     prompt_id: Optional[int] = None
+    use_cache: bool = True  # False fuerza una generacion nueva
+    # text (default) | sse | ndjson; sin valor se decide por el header Accept
+    stream_format: Optional[Literal["text", "sse", "ndjson"]] = None
 
 
 class ChatResponseChunk(BaseModel):
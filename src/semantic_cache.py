@@ -0,0 +1,315 @@
+"""
+Cache semántico de respuestas del LLM.
+
+Los prompts se embeben con el endpoint /api/embed de Ollama y los vectores
+(normalizados) viven en una matriz NumPy contigua mapeada a disco
+(np.memmap), de modo que sobreviven reinicios. Si un prompt nuevo tiene
+similitud coseno >= umbral con uno previo bajo el mismo ámbito (modelo +
+system prompt + tools) se re-emite la respuesta guardada.
+
+Como en terminología médica prompts casi idénticos difieren en un
+dígito o un código ("diabetes tipo 1" / "tipo 2", "E10" / "E11"), un hit
+exige además que los números y códigos del prompt coincidan exactamente
+(prompt_signature).
+
+Las respuestas se guardan en un log JSONL al lado de la matriz; la fila
+i de la matriz corresponde al slot i del log. Al llenarse, los slots se
+reutilizan en orden FIFO. La escritura a disco se hace por lotes en un
+thread (fuera del event loop) y el log se compacta al crecer más de
+LOG_COMPACT_RATIO veces la capacidad.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from .config import get_settings
+from .http_pool import get_http_pool
+from .ollama_router import get_ollama_router
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy es opcional
+    np = None  # type: ignore[assignment]
+
+logger = logging.getLogger("energyapp.semantic_cache")
+
+FLUSH_BATCH = 32  # entradas nuevas que disparan una escritura a disco
+LOG_COMPACT_RATIO = 2  # registros en el log / capacidad que disparan compactación
+NO_SIGNATURE = -1  # entradas de un log antiguo (sin firma): nunca coinciden
+
+SIGNATURE_RE = re.compile(r"\b[A-Za-z]\d{2}(?:\.\d+)?\b|\d+(?:[.,]\d+)?")
+
+
+def _hash63(raw: str) -> int:
+    return int.from_bytes(hashlib.blake2b(raw.encode("utf-8"), digest_size=7).digest(), "big")
+
+
+def prompt_signature(prompt: str) -> int:
+    """Hash de los números y códigos del prompt (deben coincidir para un hit)"""
+    tokens = sorted({token.upper().replace(",", ".") for token in SIGNATURE_RE.findall(prompt)})
+    return _hash63(",".join(tokens))
+
+
+def scope_key(model: str, system: Optional[str], tools: Optional[List[Dict[str, Any]]]) -> int:
+    """Ámbito del cache: solo se comparan prompts con mismo modelo/system/tools"""
+    raw = json.dumps([model, system or "", tools or []], sort_keys=True, ensure_ascii=False)
+    return _hash63(raw)
+
+
+class SemanticCache:
+    """Índice vectorial en memmap + respuestas en JSONL"""
+
+    def __init__(self, directory: str, capacity: int, threshold: float, ttl_seconds: float):
+        self.dir = Path(directory)
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.dim: Optional[int] = None
+        self._vectors = None  # np.memmap (capacity, dim) float32
+        self._scopes = np.zeros(capacity, dtype=np.int64)
+        self._signatures = np.full(capacity, NO_SIGNATURE, dtype=np.int64)
+        self._created = np.zeros(capacity, dtype=np.float64)
+        self._valid = np.zeros(capacity, dtype=bool)
+        self._lines: Dict[int, List[str]] = {}
+        self._next_slot = 0
+        self._pending: List[Dict[str, Any]] = []  # registros aún no escritos al log
+        self._log_records = 0
+        self._flush_task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._load()
+
+    @property
+    def _meta_path(self) -> Path:
+        return self.dir / "meta.json"
+
+    @property
+    def _vectors_path(self) -> Path:
+        return self.dir / "vectors.f32"
+
+    @property
+    def _log_path(self) -> Path:
+        return self.dir / "entries.jsonl"
+
+    def _open_vectors(self, mode: str) -> None:
+        self._vectors = np.memmap(
+            self._vectors_path, dtype=np.float32, mode=mode, shape=(self.capacity, self.dim)
+        )
+
+    def _load(self) -> None:
+        """Recupera el índice persistido (si coincide la capacidad)"""
+        if not self._meta_path.exists() or not self._vectors_path.exists():
+            return
+        try:
+            meta = json.loads(self._meta_path.read_text())
+            if meta.get("capacity") != self.capacity:
+                self._reset("capacity changed")
+                return
+            self.dim = int(meta["dim"])
+            self._next_slot = int(meta.get("next_slot", 0))
+            self._open_vectors("r+")
+            if self._log_path.exists():
+                with self._log_path.open(encoding="utf-8") as fh:
+                    for raw in fh:
+                        entry = json.loads(raw)
+                        slot = entry["slot"]
+                        self._scopes[slot] = entry["scope"]
+                        self._signatures[slot] = entry.get("signature", NO_SIGNATURE)
+                        self._created[slot] = entry["created"]
+                        self._valid[slot] = True
+                        self._lines[slot] = entry["lines"]
+            self._write_log(self._snapshot(), compact=True)
+            logger.info(f"SEMANTIC_CACHE_LOADED | entries={int(self._valid.sum())}, dim={self.dim}")
+        except (OSError, ValueError, KeyError, IndexError) as exc:
+            self._reset(f"load failed: {exc}")
+
+    def _reset(self, reason: str) -> None:
+        """Cache vacío: se descartan el log y meta, si no sus slots apuntarían a la matriz nueva"""
+        logger.warning(f"SEMANTIC_CACHE_RESET | reason={reason}")
+        self.dim = None
+        self._vectors = None
+        self._next_slot = 0
+        self._valid[:] = False
+        self._lines.clear()
+        self._log_records = 0
+        for path in (self._log_path, self._meta_path):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _record(self, slot: int) -> Dict[str, Any]:
+        return {
+            "slot": slot,
+            "scope": int(self._scopes[slot]),
+            "signature": int(self._signatures[slot]),
+            "created": float(self._created[slot]),
+            "lines": self._lines[slot],
+        }
+
+    def _snapshot(self) -> List[Dict[str, Any]]:
+        """Último registro de cada slot válido (contenido del log compactado)"""
+        return [self._record(int(slot)) for slot in np.flatnonzero(self._valid)]
+
+    def _meta(self) -> Dict[str, Any]:
+        return {"capacity": self.capacity, "dim": self.dim, "next_slot": self._next_slot}
+
+    def _write_log(self, records: List[Dict[str, Any]], compact: bool) -> None:
+        """compact: reescribe el log con records; si no, los agrega al final"""
+        if compact:
+            tmp = self._log_path.with_suffix(".tmp")
+            with tmp.open("w", encoding="utf-8") as fh:
+                for record in records:
+                    fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+            tmp.replace(self._log_path)
+            self._log_records = len(records)
+        else:
+            with self._log_path.open("a", encoding="utf-8") as fh:
+                for record in records:
+                    fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._log_records += len(records)
+
+    def _persist(self, records: List[Dict[str, Any]], compact: bool, meta: Dict[str, Any]) -> None:
+        """Escritura a disco (en un thread): log, meta y páginas sucias del memmap"""
+        self._write_log(records, compact)
+        self._meta_path.write_text(json.dumps(meta))
+        if self._vectors is not None:
+            self._vectors.flush()
+
+    def _take_batch(self) -> Tuple[List[Dict[str, Any]], bool, Dict[str, Any]]:
+        """Registros pendientes (o snapshot completo si toca compactar) + meta, tomados en el loop"""
+        compact = self._log_records + len(self._pending) > LOG_COMPACT_RATIO * self.capacity
+        records = self._snapshot() if compact else self._pending
+        self._pending = []
+        return records, compact, self._meta()
+
+    def lookup(self, vector: "np.ndarray", scope: int, signature: int) -> Optional[List[str]]:
+        """Respuesta del vecino más cercano (mismos números/códigos) si supera el umbral"""
+        if self._vectors is None or vector.shape[0] != self.dim:
+            self.misses += 1
+            return None
+        now = time.time()
+        mask = (
+            self._valid & (self._scopes == scope) & (self._signatures == signature)
+            & (self._created > now - self.ttl_seconds)
+        )
+        slots = np.flatnonzero(mask)
+        if slots.size == 0:
+            self.misses += 1
+            return None
+        scores = self._vectors[slots] @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._lines[int(slots[best])]
+
+    def store(self, vector: "np.ndarray", scope: int, signature: int, lines: List[str]) -> None:
+        if self._vectors is None:
+            self.dim = int(vector.shape[0])
+            self._open_vectors("w+")
+        elif vector.shape[0] != self.dim:
+            return
+        slot = self._next_slot
+        self._next_slot = (slot + 1) % self.capacity
+        self._vectors[slot] = vector
+        self._scopes[slot] = scope
+        self._signatures[slot] = signature
+        self._created[slot] = time.time()
+        self._valid[slot] = True
+        self._lines[slot] = lines
+        self._pending.append(self._record(slot))
+        if len(self._pending) >= FLUSH_BATCH:
+            self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        """Persiste lo pendiente en un thread; un solo flush en curso a la vez"""
+        if self._flush_task is not None and not self._flush_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        self._flush_task = loop.create_task(asyncio.to_thread(self._persist, *self._take_batch()))
+        self._flush_task.add_done_callback(self._flush_done)
+
+    @staticmethod
+    def _flush_done(task: "asyncio.Task") -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"SEMANTIC_CACHE_FLUSH_FAILED | error={task.exception()}")
+
+    def flush(self) -> None:
+        """Escritura síncrona de lo pendiente (shutdown)"""
+        if self._pending or self._vectors is not None:
+            self._persist(*self._take_batch())
+
+    async def aclose(self) -> None:
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": int(self._valid.sum()),
+            "capacity": self.capacity,
+            "dim": self.dim,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+async def embed(text: str, model: str) -> Optional["np.ndarray"]:
+    """Embedding normalizado via Ollama /api/embed (None si falla)"""
+    backend = get_ollama_router().pick()
+    try:
+        resp = await get_http_pool().request(
+            backend.url, "POST", "/api/embed", json={"model": model, "input": text}, timeout=10.0
+        )
+        resp.raise_for_status()
+        data = resp.json()
+        vector = np.asarray(data["embeddings"][0], dtype=np.float32)
+    except (httpx.HTTPError, KeyError, IndexError, ValueError) as exc:
+        logger.warning(f"SEMANTIC_CACHE_EMBED_FAILED | error={exc}")
+        return None
+    norm = float(np.linalg.norm(vector))
+    if norm == 0.0:
+        return None
+    return vector / norm
+
+
+# Singleton
+_semantic_cache: Optional[SemanticCache] = None
+
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """Instancia compartida, o None si está deshabilitado o falta numpy"""
+    global _semantic_cache
+    settings = get_settings()
+    if not settings.semantic_cache_enabled or np is None:
+        return None
+    if _semantic_cache is None:
+        _semantic_cache = SemanticCache(
+            directory=settings.semantic_cache_dir,
+            capacity=settings.semantic_cache_capacity,
+            threshold=settings.semantic_cache_threshold,
+            ttl_seconds=settings.semantic_cache_ttl_seconds,
+        )
+    return _semantic_cache
+
+
+async def close_semantic_cache() -> None:
+    if _semantic_cache is not None:
+        await _semantic_cache.aclose()
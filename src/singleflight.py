@@ -0,0 +1,110 @@
+"""
+Coalescing (single-flight) de generaciones idénticas en curso.
+
+Si llega una request con el mismo payload que una generación que todavía
+está en streaming, se engancha a ese mismo stream upstream: recibe las
+líneas ya producidas y luego las nuevas en vivo, sin lanzar una segunda
+generación en Ollama. El stream upstream corre en una task propia y se
+cancela solo cuando no queda ningún suscriptor.
+"""
+import asyncio
+import logging
+from typing import AsyncGenerator, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("energyapp.singleflight")
+
+
+class SharedGeneration:
+    """Stream upstream compartido: buffer de líneas + suscriptores"""
+
+    def __init__(self, key: str, source: AsyncIterator[str], on_finish: Callable[[str], None]):
+        self.key = key
+        self.lines: List[str] = []
+        self.done = False
+        self.aborted = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self._on_finish = on_finish
+        self._task = asyncio.create_task(self._run(source))
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _run(self, source: AsyncIterator[str]) -> None:
+        try:
+            async for line in source:
+                self.lines.append(line)
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = asyncio.CancelledError()
+            raise
+        except Exception as exc:
+            self.error = exc
+        finally:
+            self.done = True
+            self._on_finish(self.key)
+            self._notify()
+
+    async def subscribe(self) -> AsyncGenerator[str, None]:
+        """Líneas desde el inicio del stream y luego en vivo"""
+        self.subscribers += 1
+        index = 0
+        try:
+            while True:
+                changed = self._changed
+                while index < len(self.lines):
+                    yield self.lines[index]
+                    index += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                # Nadie escucha: abortar la generación upstream
+                self.aborted = True
+                self._task.cancel()
+
+
+class SingleFlight:
+    """Registro de generaciones en curso por clave de payload"""
+
+    def __init__(self):
+        self._inflight: Dict[str, SharedGeneration] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def join(self, key: str, factory: Callable[[], AsyncIterator[str]]) -> Tuple[SharedGeneration, bool]:
+        """Retorna (generación, es_líder); crea la generación si no existe"""
+        flight = self._inflight.get(key)
+        if flight is not None and not (flight.done or flight.aborted):
+            self.coalesced += 1
+            logger.info(f"SINGLEFLIGHT_JOIN | key={key[:12]}, subscribers={flight.subscribers + 1}")
+            return flight, False
+        self.leaders += 1
+        flight = SharedGeneration(key, factory(), self._finish)
+        self._inflight[key] = flight
+        return flight, True
+
+    def _finish(self, key: str) -> None:
+        flight = self._inflight.get(key)
+        if flight is not None and flight.done:
+            del self._inflight[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._inflight), "leaders": self.leaders, "coalesced": self.coalesced}
+
+
+# Singleton
+_single_flight: Optional[SingleFlight] = None
+
+
+def get_single_flight() -> SingleFlight:
+    global _single_flight
+    if _single_flight is None:
+        _single_flight = SingleFlight()
+    return _single_flight
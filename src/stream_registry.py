@@ -0,0 +1,259 @@
+"""
+Streams de /chat reanudables.
+
+Cada generación de /chat corre en una task productora propia y sus
+eventos (ya agrupados, ver chat_stream) se numeran y guardan en un ring
+buffer acotado, identificado por un stream id. La respuesta HTTP es solo
+un suscriptor: si el cliente se cae, la generación sigue y el cliente
+puede re-engancharse con GET /chat/streams/{id}?offset=N para recibir lo
+que perdió y luego la cola en vivo. El offset es el seq del evento (id en
+sse, campo seq en ndjson); en text los frames no llevan seq, así que un
+cliente text solo puede reanudar con offset=0 (re-recibe la respuesta
+completa mientras siga en el buffer) y debe descartar lo ya mostrado.
+
+Si no queda ningún suscriptor, la generación se aborta pasado
+stream_resume_grace_seconds. Los streams terminados se conservan
+stream_retention_seconds para permitir recuperar el final.
+
+Un POST /chat con header Idempotency-Key queda asociado (por usuario,
+durante idempotency_ttl_seconds) a su stream: los reintentos se enganchan
+al stream original en vez de crear otra conversación y otra generación.
+"""
+import asyncio
+import hashlib
+import itertools
+import logging
+import json
+import secrets
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from fastapi import Request
+
+from .chat_stream import RENDERERS, ChatEvent
+from .config import get_settings
+from .streaming import ClientDisconnected, until_disconnected
+
+logger = logging.getLogger("energyapp.streams")
+
+
+class StreamGone(Exception):
+    """El offset pedido ya salió del ring buffer"""
+
+
+@dataclass
+class IdempotencyEntry:
+    stream_id: str
+    conversation_id: int
+    fingerprint: str
+    expires_at: float
+
+
+def request_fingerprint(payload: Dict[str, Any]) -> str:
+    """Hash del body: una misma Idempotency-Key con otro body es un error del cliente"""
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ChatStream:
+    """Eventos numerados de una generación + suscriptores"""
+
+    def __init__(self, stream_id: str, user_id: int, conversation_id: int, max_events: int, grace_seconds: float):
+        self.id = stream_id
+        self.user_id = user_id
+        self.conversation_id = conversation_id
+        self.grace_seconds = grace_seconds
+        self.events: Deque[ChatEvent] = deque(maxlen=max_events)
+        self.first_seq = 0
+        self.next_seq = 0
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._abandon_handle: Optional[asyncio.TimerHandle] = None
+
+    def start(self, source: AsyncIterator[List[ChatEvent]]) -> None:
+        self._task = asyncio.create_task(self._run(source))
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _append(self, event: ChatEvent) -> None:
+        if len(self.events) == self.events.maxlen:
+            self.first_seq += 1
+        event.seq = self.next_seq
+        self.next_seq += 1
+        self.events.append(event)
+
+    async def _run(self, source: AsyncIterator[List[ChatEvent]]) -> None:
+        try:
+            async for batch in source:
+                for event in batch:
+                    self._append(event)
+                self._notify()
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            logger.exception(f"CHAT_STREAM_FAILED | stream_id={self.id}")
+        finally:
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            self.done = True
+            self.finished_at = time.monotonic()
+            self._notify()
+
+    async def subscribe(self, offset: int = 0) -> AsyncGenerator[List[ChatEvent], None]:
+        """Lotes de eventos desde offset (replay) y luego en vivo"""
+        if offset < self.first_seq:
+            raise StreamGone(f"offset {offset} < {self.first_seq}")
+        self.subscribers += 1
+        if self._abandon_handle is not None:
+            self._abandon_handle.cancel()
+            self._abandon_handle = None
+        index = offset
+        try:
+            while True:
+                changed = self._changed
+                if index < self.first_seq:
+                    raise StreamGone(f"offset {index} < {self.first_seq}")
+                if index < self.next_seq:
+                    batch = list(itertools.islice(self.events, index - self.first_seq, None))
+                    index = self.next_seq
+                    yield batch
+                    continue
+                if self.done:
+                    return
+                await changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                # Nadie escucha: se espera un re-enganche antes de abortar
+                self._abandon_handle = asyncio.get_running_loop().call_later(self.grace_seconds, self._abandon)
+
+    def _abandon(self) -> None:
+        self._abandon_handle = None
+        if self.subscribers == 0 and not self.done and self._task is not None:
+            logger.info(f"CHAT_STREAM_ABANDONED | stream_id={self.id}, events={self.next_seq}")
+            self._task.cancel()
+
+    def cancel(self) -> None:
+        if self._task is not None and not self.done:
+            self._task.cancel()
+
+
+class StreamRegistry:
+    """Streams en curso y recién terminados, por id"""
+
+    def __init__(self, max_events: int, grace_seconds: float, retention_seconds: float, idempotency_ttl: float):
+        self.max_events = max_events
+        self.grace_seconds = grace_seconds
+        self.retention_seconds = retention_seconds
+        self.idempotency_ttl = idempotency_ttl
+        self._streams: Dict[str, ChatStream] = {}
+        self._idempotency: Dict[Tuple[int, str], IdempotencyEntry] = {}
+        self.created = 0
+        self.resumed = 0
+        self.idempotent_replays = 0
+
+    def _purge(self) -> None:
+        now = time.monotonic()
+        expired = [
+            sid for sid, s in self._streams.items()
+            if s.done and s.finished_at is not None and now - s.finished_at > self.retention_seconds
+        ]
+        for sid in expired:
+            del self._streams[sid]
+        stale = [key for key, entry in self._idempotency.items() if entry.expires_at < now]
+        for key in stale:
+            del self._idempotency[key]
+
+    def create(self, user_id: int, conversation_id: int) -> ChatStream:
+        self._purge()
+        stream = ChatStream(
+            secrets.token_urlsafe(12), user_id, conversation_id, self.max_events, self.grace_seconds
+        )
+        self._streams[stream.id] = stream
+        self.created += 1
+        return stream
+
+    def get(self, stream_id: str) -> Optional[ChatStream]:
+        self._purge()
+        return self._streams.get(stream_id)
+
+    def lookup_idempotent(self, user_id: int, key: str) -> Optional[IdempotencyEntry]:
+        self._purge()
+        return self._idempotency.get((user_id, key))
+
+    def remember_idempotent(self, user_id: int, key: str, fingerprint: str, stream: ChatStream) -> None:
+        self._idempotency[(user_id, key)] = IdempotencyEntry(
+            stream_id=stream.id,
+            conversation_id=stream.conversation_id,
+            fingerprint=fingerprint,
+            expires_at=time.monotonic() + self.idempotency_ttl,
+        )
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "active": sum(1 for s in self._streams.values() if not s.done),
+            "retained": sum(1 for s in self._streams.values() if s.done),
+            "detached": sum(1 for s in self._streams.values() if not s.done and s.subscribers == 0),
+            "created": self.created,
+            "resumed": self.resumed,
+            "idempotency_keys": len(self._idempotency),
+            "idempotent_replays": self.idempotent_replays,
+        }
+
+    async def aclose(self) -> None:
+        """Aborta los streams en curso (shutdown); cada uno persiste lo generado"""
+        tasks = [s._task for s in self._streams.values() if s._task is not None and not s.done]
+        for stream in self._streams.values():
+            stream.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def stream_body(
+    request: Request,
+    stream: ChatStream,
+    offset: int,
+    stream_format: str,
+) -> AsyncGenerator[str, None]:
+    """Cuerpo HTTP de un suscriptor (un envío por lote); termina si el cliente se va"""
+    render = RENDERERS[stream_format]
+    try:
+        async for batch in until_disconnected(request, stream.subscribe(offset)):
+            chunk = "".join(render(event) for event in batch)
+            if chunk:
+                yield chunk
+    except ClientDisconnected:
+        logger.info(f"CHAT_STREAM_DETACHED | stream_id={stream.id}, grace={stream.grace_seconds}")
+    except StreamGone as exc:
+        # El suscriptor quedó atrás del ring buffer con los headers ya enviados:
+        # se cierra el stream con un evento de error en vez de cortar la conexión
+        logger.warning(f"CHAT_STREAM_GONE | stream_id={stream.id}, error={exc}")
+        yield render(ChatEvent("error", {
+            "code": "stream_gone",
+            "message": f"Se perdieron eventos del stream; reanuda desde el offset {stream.first_seq}.",
+        }))
+
+
+# Singleton
+_registry: Optional[StreamRegistry] = None
+
+
+def get_stream_registry() -> StreamRegistry:
+    global _registry
+    if _registry is None:
+        settings = get_settings()
+        _registry = StreamRegistry(
+            max_events=settings.stream_buffer_max_events,
+            grace_seconds=settings.stream_resume_grace_seconds,
+            retention_seconds=settings.stream_retention_seconds,
+            idempotency_ttl=settings.idempotency_ttl_seconds,
+        )
+    return _registry
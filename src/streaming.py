@@ -0,0 +1,63 @@
+"""
+Utilidades de streaming para /chat.
+"""
+import asyncio
+from typing import AsyncGenerator, AsyncIterator, Optional, TypeVar
+
+from fastapi import Request
+
+T = TypeVar("T")
+
+
+class ClientDisconnected(Exception):
+    """El cliente cerró la conexión mientras se generaba la respuesta"""
+
+
+async def _wait_disconnect(request: Request) -> None:
+    """
+    Espera el mensaje http.disconnect del servidor ASGI.
+
+    El body ya fue leído, así que lo único que puede llegar por receive()
+    es la desconexión. Request.is_disconnected() no sirve aquí: con
+    BaseHTTPMiddleware de por medio el receive envuelto nunca responde
+    dentro de un scope ya cancelado.
+    """
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def until_disconnected(request: Request, source: AsyncIterator[T]) -> AsyncGenerator[T, None]:
+    """
+    Re-emite source hasta que termine o el cliente se desconecte.
+
+    Al detectar la desconexión se cancela la lectura pendiente y se cierra
+    source (lo que cierra el stream HTTP hacia Ollama y aborta la
+    generación), y se levanta ClientDisconnected.
+    """
+    watcher = asyncio.create_task(_wait_disconnect(request))
+    pending: Optional[asyncio.Future] = None
+    try:
+        while True:
+            pending = asyncio.ensure_future(source.__anext__())  # type: ignore[arg-type]
+            done, _ = await asyncio.wait({pending, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if pending not in done:
+                raise ClientDisconnected()
+            try:
+                item = pending.result()
+            except StopAsyncIteration:
+                return
+            pending = None
+            yield item
+    finally:
+        watcher.cancel()
+        if pending is not None and not pending.done():
+            pending.cancel()
+            try:
+                await pending
+            except (asyncio.CancelledError, Exception):
+                pass
+        aclose = getattr(source, "aclose", None)
+        if aclose is not None:
+            await aclose()
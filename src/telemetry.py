@@ -0,0 +1,148 @@
+"""
+Telemetría por generación.
+
+Cada respuesta del asistente lleva un GenerationTrace que se completa
+durante el stream (primer token, backend, cache, tools) y con los
+contadores del chunk final de Ollama. El resultado se guarda en
+Message.meta y se agrega en percentiles por modelo y día para
+planificación de capacidad (ver /admin/llm-metrics).
+"""
+import math
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+NS_PER_MS = 1_000_000
+PERCENTILE_FIELDS = ("ttft_ms", "latency_ms", "tokens_per_sec", "prompt_tokens")
+# Medidas del backend: en respuestas servidas desde cache son las de la generación original
+BACKEND_FIELDS = ("tokens_per_sec", "prompt_tokens")
+
+
+@dataclass
+class GenerationTrace:
+    """Mediciones de una generación (se guarda en Message.meta)"""
+    model: str
+    started: float = field(default_factory=time.monotonic)
+    first_token_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    backend: Optional[str] = None
+    cache: Optional[str] = None  # exact | semantic | coalesced, de la ronda en curso
+    model_rounds: int = 0  # llamadas al modelo (1 + rondas de tools)
+    cached_rounds: int = 0  # de esas, las servidas desde cache o coalescing
+    tool_calls: int = 0
+    tool_rounds: int = 0  # rondas de tools devueltas al modelo
+    tool_prefetched: int = 0  # búsquedas anticipadas desde el prompt
+    tool_prefetch_hits: int = 0  # de esas, las que el modelo pidió
+    token_chunks: int = 0  # chunks de texto recibidos de Ollama
+    token_frames: int = 0  # frames de texto enviados al cliente (agrupados)
+    final: Dict[str, Any] = field(default_factory=dict)
+
+    def start_round(self) -> None:
+        """Cada llamada al modelo tiene su propio origen: una ronda de cache no marca a las siguientes"""
+        self.model_rounds += 1
+        self.cache = None
+
+    def mark_cache(self, kind: str) -> None:
+        self.cache = kind
+        self.cached_rounds += 1
+
+    def mark_first_token(self) -> None:
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+
+    def observe_final(self, data: Dict[str, Any]) -> None:
+        """Contadores del chunk final (done=true) de Ollama; se suman entre rondas de tools.
+
+        Un chunk re-emitido desde cache o coalescing (en la ronda en curso)
+        trae los contadores de otra generación: no se cuentan.
+        """
+        if self.cache is not None:
+            return
+        for key in ("eval_count", "eval_duration", "prompt_eval_count", "prompt_eval_duration", "load_duration"):
+            if key in data:
+                self.final[key] = self.final.get(key, 0) + data[key]
+
+    def finish(self) -> None:
+        if self.finished_at is None:
+            self.finished_at = time.monotonic()
+
+    def as_meta(self) -> Dict[str, Any]:
+        self.finish()
+        meta: Dict[str, Any] = {
+            "model": self.model,
+            "backend": self.backend,
+            "ttft_ms": round((self.first_token_at - self.started) * 1000, 1) if self.first_token_at else None,
+            "latency_ms": round((self.finished_at - self.started) * 1000, 1),  # type: ignore[operator]
+            # Solo si toda la respuesta salió de cache; si no, las rondas en vivo cuentan como tales
+            "cache_hit": self.cache if self.model_rounds and self.cached_rounds == self.model_rounds else None,
+            "cached_rounds": self.cached_rounds,
+            "tool_hit": self.tool_calls > 0,
+            "tool_calls": self.tool_calls,
+            "tool_rounds": self.tool_rounds,
+            "tool_prefetched": self.tool_prefetched,
+            "tool_prefetch_hits": self.tool_prefetch_hits,
+            "token_chunks": self.token_chunks,
+            "token_frames": self.token_frames,
+        }
+        eval_count = self.final.get("eval_count")
+        eval_duration = self.final.get("eval_duration")
+        meta["completion_tokens"] = eval_count
+        meta["tokens_per_sec"] = (
+            round(eval_count / (eval_duration / 1e9), 2) if eval_count and eval_duration else None
+        )
+        meta["prompt_tokens"] = self.final.get("prompt_eval_count")
+        if "prompt_eval_duration" in self.final:
+            meta["prompt_eval_ms"] = round(self.final["prompt_eval_duration"] / NS_PER_MS, 1)
+        if "load_duration" in self.final:
+            meta["load_ms"] = round(self.final["load_duration"] / NS_PER_MS, 1)
+        return meta
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Percentil por rango más cercano sobre una lista ya ordenada"""
+    rank = max(math.ceil(pct / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+def aggregate(rows: Iterable[Tuple[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Agrega (día ISO, meta) en p50/p95/p99 por modelo y día.
+
+    Solo se consideran metas con telemetría (las que tienen latency_ms).
+    Los percentiles de BACKEND_FIELDS excluyen las respuestas de cache.
+    """
+    groups: Dict[Tuple[str, str], List[Dict[str, Any]]] = defaultdict(list)
+    for day, meta in rows:
+        if meta.get("latency_ms") is None:
+            continue
+        groups[(meta.get("model") or "unknown", day)].append(meta)
+
+    result: List[Dict[str, Any]] = []
+    for (model, day), metas in sorted(groups.items(), key=lambda item: (item[0][1], item[0][0])):
+        entry: Dict[str, Any] = {
+            "model": model,
+            "day": day,
+            "count": len(metas),
+            "cache_hits": sum(1 for m in metas if m.get("cache_hit")),
+            "tool_hits": sum(1 for m in metas if m.get("tool_hit")),
+            "truncated": sum(1 for m in metas if m.get("truncated")),
+        }
+        chunks = sum(m.get("token_chunks") or 0 for m in metas)
+        frames = sum(m.get("token_frames") or 0 for m in metas)
+        entry["coalescing"] = {
+            "token_chunks": chunks,
+            "token_frames": frames,
+            "frame_reduction": round(1 - frames / chunks, 3) if chunks else None,
+        }
+        for name in PERCENTILE_FIELDS:
+            values = sorted(
+                m[name] for m in metas
+                if m.get(name) is not None and not (name in BACKEND_FIELDS and m.get("cache_hit"))
+            )
+            entry[name] = (
+                {"p50": percentile(values, 50), "p95": percentile(values, 95), "p99": percentile(values, 99)}
+                if values else None
+            )
+        result.append(entry)
+    return result
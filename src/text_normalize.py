@@ -0,0 +1,46 @@
+"""
+Normalización de texto en español para búsqueda.
+
+Plegado de acentos, tokenización y un stemmer liviano de sufijos
+(plurales y derivaciones frecuentes en terminología médica). No busca
+ser un stemmer completo: basta con que la misma palabra en singular,
+plural o con/sin tilde caiga en la misma raíz en índice y consulta.
+"""
+import re
+import unicodedata
+from typing import List
+
+TOKEN_RE = re.compile(r"[a-z0-9]{2,}|\d")  # de un carácter solo dígitos ("tipo 2"), no "y"
+
+STOPWORDS = frozenset(
+    "a al con de del desde e el en entre es la las lo los o otra otras otro otros para "
+    "por que se sin sobre su sus u un una uno unos unas y".split()
+)
+
+# Del más largo al más corto; se quita el primero que deje una raíz de al menos 4 letras
+SUFFIXES = (
+    "aciones", "amientos", "imientos", "acion", "amiento", "imiento", "mente",
+    "idades", "idad", "ivas", "ivos", "iva", "ivo", "icas", "icos", "ica", "ico",
+    "osas", "osos", "osa", "oso", "ales", "al", "ares", "ar", "es", "as", "os", "s", "a", "o", "e",
+)
+MIN_STEM = 4
+
+
+def fold_accents(text: str) -> str:
+    """Minúsculas y sin diacríticos (ñ -> n)"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def stem(token: str) -> str:
+    if token.isdigit():
+        return token
+    for suffix in SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= MIN_STEM:
+            return token[: -len(suffix)]
+    return token
+
+
+def search_terms(text: str) -> List[str]:
+    """Términos indexables: plegados, sin stopwords y con stem"""
+    return [stem(token) for token in TOKEN_RE.findall(fold_accents(text)) if token not in STOPWORDS]
@@ -5,13 +5,28 @@ Este módulo implementa el sistema de herramientas que permite a Qwen
 ejecutar funciones reales en el backend, como búsquedas en CIE-10.
 """
 
-from .cie10_tools import search_cie10_tool, get_cie10_code_tool, execute_cie10_tool
-from .registry import AVAILABLE_TOOLS, get_tool_definitions
+from .cie10_tools import search_cie10_tool, get_cie10_code_tool, execute_cie10_tool, format_cie10_result
+from .registry import AVAILABLE_TOOLS, ToolRegistry, ToolSpec, get_tool_definitions, get_tool_registry
+from .arguments import ToolArgumentError, compile_arguments
+from .runner import ToolCall, parse_tool_calls, run_tool_calls, tool_round_messages
+from .prefetch import ToolPrefetcher, predict_tool_calls
 
 __all__ = [
     "search_cie10_tool",
     "get_cie10_code_tool",
     "execute_cie10_tool",
+    "format_cie10_result",
     "AVAILABLE_TOOLS",
+    "ToolRegistry",
+    "ToolSpec",
     "get_tool_definitions",
+    "get_tool_registry",
+    "ToolArgumentError",
+    "compile_arguments",
+    "ToolCall",
+    "parse_tool_calls",
+    "run_tool_calls",
+    "tool_round_messages",
+    "ToolPrefetcher",
+    "predict_tool_calls",
 ]
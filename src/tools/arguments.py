@@ -0,0 +1,176 @@
+"""
+Validación y normalización de argumentos de tools.
+
+El JSON Schema de cada tool (parameters) se compila una vez al
+registrarla en una lista de campos con su conversión de tipo, límites,
+default y normalizador. Los argumentos del modelo se validan y
+normalizan antes de ejecutar: se descartan claves desconocidas, se
+convierten tipos ("10" -> 10), se acotan enteros a minimum/maximum y se
+aplican normalizadores por campo (código en mayúsculas, espacios
+colapsados), así `e10 ` / `E10` comparten resultado. Si el backend
+ignora tildes, la clave de cache usa además su plegado (folds), y
+`hipertensión` / `Hipertension` también lo comparten.
+
+No depende de jsonschema: solo se soportan type, default, minimum,
+maximum, enum, minLength/maxLength y required, que es lo que usan las
+tools del registro.
+"""
+import math
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..text_normalize import fold_accents
+
+Normalizer = Callable[[Any], Any]
+ArgumentsKey = Tuple[Tuple[str, Any], ...]
+
+
+class ToolArgumentError(ValueError):
+    """Argumentos que no cumplen el schema de la tool"""
+
+
+def fold_whitespace(text: str) -> str:
+    return " ".join(text.split())
+
+
+def normalize_code(value: str) -> str:
+    """Código CIE-10: sin espacios y en mayúsculas (` e10.9 ` -> `E10.9`)"""
+    return "".join(value.split()).upper()
+
+
+def _to_str(value: Any) -> str:
+    if isinstance(value, (dict, list)):
+        raise ToolArgumentError("se esperaba texto")
+    return str(value).strip()
+
+
+def _to_int(value: Any) -> int:
+    if isinstance(value, bool):
+        raise ToolArgumentError("se esperaba un entero")
+    try:
+        # int(float("inf")) levanta OverflowError; NaN da ValueError
+        return int(float(value)) if isinstance(value, (str, float)) else int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ToolArgumentError("se esperaba un entero")
+
+
+def _to_float(value: Any) -> float:
+    if isinstance(value, bool):
+        raise ToolArgumentError("se esperaba un número")
+    try:
+        number = float(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ToolArgumentError("se esperaba un número")
+    if not math.isfinite(number):
+        raise ToolArgumentError("se esperaba un número finito")
+    return number
+
+
+def _to_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+        return value.strip().lower() == "true"
+    raise ToolArgumentError("se esperaba true/false")
+
+
+COERCERS: Dict[str, Callable[[Any], Any]] = {
+    "string": _to_str,
+    "integer": _to_int,
+    "number": _to_float,
+    "boolean": _to_bool,
+}
+
+
+@dataclass
+class CompiledField:
+    name: str
+    coerce: Callable[[Any], Any]
+    required: bool
+    default: Any = None
+    minimum: Optional[float] = None
+    maximum: Optional[float] = None
+    min_length: Optional[int] = None
+    max_length: Optional[int] = None
+    enum: Optional[Tuple[Any, ...]] = None
+    normalize: Optional[Normalizer] = None
+    fold: Optional[Normalizer] = None  # solo para la clave de cache
+
+
+class CompiledArguments:
+    """Schema de una tool compilado: validate() normaliza, key() indexa el cache"""
+
+    def __init__(self, fields: List[CompiledField]):
+        self.fields = fields
+
+    def validate(self, arguments: Any) -> Dict[str, Any]:
+        if not isinstance(arguments, dict):
+            raise ToolArgumentError("los argumentos deben ser un objeto")
+        normalized: Dict[str, Any] = {}
+        for f in self.fields:
+            value = arguments.get(f.name)
+            if value is None or value == "":
+                if f.required:
+                    raise ToolArgumentError(f"falta '{f.name}'")
+                if f.default is not None:
+                    normalized[f.name] = f.default
+                continue
+            try:
+                value = f.coerce(value)
+            except ToolArgumentError as exc:
+                raise ToolArgumentError(f"'{f.name}': {exc}")
+            if f.normalize is not None:
+                value = f.normalize(value)
+            if f.minimum is not None and value < f.minimum:
+                value = type(value)(f.minimum)
+            if f.maximum is not None and value > f.maximum:
+                value = type(value)(f.maximum)
+            if f.max_length is not None and isinstance(value, str):
+                value = value[:f.max_length]
+            if f.min_length is not None and isinstance(value, str) and len(value) < f.min_length:
+                raise ToolArgumentError(f"'{f.name}' debe tener al menos {f.min_length} caracteres")
+            if f.enum is not None and value not in f.enum:
+                raise ToolArgumentError(f"'{f.name}' debe ser uno de {list(f.enum)}")
+            if value == "" and f.required:
+                raise ToolArgumentError(f"falta '{f.name}'")
+            normalized[f.name] = value
+        return normalized
+
+    def key(self, normalized: Dict[str, Any]) -> ArgumentsKey:
+        items = []
+        for f in self.fields:
+            value = normalized.get(f.name)
+            if value is not None and f.fold is not None:
+                value = f.fold(value)
+            items.append((f.name, value))
+        return tuple(items)
+
+
+def compile_arguments(
+    parameters: Dict[str, Any],
+    normalizers: Optional[Dict[str, Normalizer]] = None,
+    folds: Optional[Dict[str, Normalizer]] = None,
+) -> CompiledArguments:
+    """Compila el schema (parameters) de una tool"""
+    normalizers = normalizers or {}
+    folds = folds or {}
+    required = set(parameters.get("required", []))
+    fields: List[CompiledField] = []
+    for name, prop in parameters.get("properties", {}).items():
+        coerce = COERCERS.get(prop.get("type", "string"))
+        if coerce is None:
+            raise ValueError(f"Tipo no soportado en el schema de '{name}': {prop.get('type')}")
+        fields.append(CompiledField(
+            name=name,
+            coerce=coerce,
+            required=name in required,
+            default=prop.get("default"),
+            minimum=prop.get("minimum"),
+            maximum=prop.get("maximum"),
+            min_length=prop.get("minLength"),
+            max_length=prop.get("maxLength"),
+            enum=tuple(prop["enum"]) if "enum" in prop else None,
+            normalize=normalizers.get(name),
+            fold=folds.get(name),
+        ))
+    return CompiledArguments(fields)
@@ -1,11 +1,13 @@
 """
 Herramientas CIE-10 para Tool Calling
 
-Permite a Qwen buscar códigos médicos en la base de datos real.
+Permite a Qwen buscar códigos médicos en la base de datos real, via el
+servicio CIE-10 compartido con el router /cie10 (en proceso por defecto).
 """
-import httpx
 from typing import Dict, Any
 
+from ..cie10_service import get_cie10_service
+
 
 async def search_cie10_tool(query: str, limit: int = 10) -> Dict[str, Any]:
     """
@@ -18,18 +20,12 @@ async def search_cie10_tool(query: str, limit: int = 10) -> Dict[str, Any]:
     Returns:
         Lista de códigos CIE-10 encontrados
     """
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            "http://localhost:8001/cie10/search",
-            params={"q": query, "limit": min(limit, 50)},
-            timeout=10.0
-        )
-        response.raise_for_status()
-        return {
-            "success": True,
-            "data": response.json(),
-            "query": query
-        }
+    data = await get_cie10_service().search(query, limit=min(limit, 50))
+    return {
+        "success": True,
+        "data": data,
+        "query": query
+    }
 
 
 async def get_cie10_code_tool(code: str) -> Dict[str, Any]:
@@ -42,22 +38,26 @@ async def get_cie10_code_tool(code: str) -> Dict[str, Any]:
     Returns:
         Información del código CIE-10
     """
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"http://localhost:8001/cie10/{code}",
-            timeout=10.0
-        )
-        response.raise_for_status()
+    data = await get_cie10_service().get_code(code)
+    if data is None:
         return {
-            "success": True,
-            "data": response.json(),
+            "success": False,
+            "error": f"Código CIE-10 '{code}' no encontrado",
             "code": code
         }
+    return {
+        "success": True,
+        "data": data,
+        "code": code
+    }
 
 
 async def execute_cie10_tool(tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Ejecuta una herramienta CIE-10 basada en el nombre y argumentos.
+    Ejecuta una herramienta CIE-10 por nombre.
+
+    Se mantiene por compatibilidad: delega en el registro de tools, que
+    valida los argumentos y aplica cache, timeout y cupo de concurrencia.
 
     Args:
         tool_name: Nombre de la herramienta a ejecutar
@@ -66,23 +66,32 @@ async def execute_cie10_tool(tool_name: str, arguments: Dict[str, Any]) -> Dict[
     Returns:
         Resultado de la ejecución
     """
-    try:
-        if tool_name == "search_cie10":
-            return await search_cie10_tool(
-                query=arguments.get("query", ""),
-                limit=arguments.get("limit", 10)
-            )
-        elif tool_name == "get_cie10_code":
-            return await get_cie10_code_tool(
-                code=arguments.get("code", "")
-            )
-        else:
-            return {
-                "success": False,
-                "error": f"Tool desconocida: {tool_name}"
-            }
-    except Exception as e:
-        return {
-            "success": False,
-            "error": str(e)
-        }
+    from .registry import get_tool_registry  # el registro importa este módulo
+
+    return await get_tool_registry().execute(tool_name, arguments)
+
+
+def format_cie10_result(result: dict) -> str:
+    """Formatea los resultados de CIE-10 para presentación al usuario"""
+    if not result.get("success"):
+        return f"\nError: {result.get('error')}\n"
+
+    data = result.get("data", [])
+    if isinstance(data, dict):
+        # Código individual
+        formatted = f"\nCódigo CIE-10: {data.get('code')}\n"
+        formatted += f"Descripción: {data.get('description')}\n"
+        formatted += f"Nivel: {data.get('level')} | Rango: {'Sí' if data.get('is_range') else 'No'}\n"
+        if data.get('parent_code'):
+            formatted += f"Código padre: {data.get('parent_code')}\n"
+        formatted += "\n"
+        return formatted
+    elif isinstance(data, list):
+        # Lista de códigos
+        formatted = f"\nResultados para '{result.get('query')}':\n\n"
+        for idx, item in enumerate(data[:10], 1):
+            formatted += f"{idx}. {item.get('code')} - {item.get('description')}\n"
+        formatted += "\n"
+        return formatted
+
+    return "\n"
@@ -0,0 +1,97 @@
+"""
+Prefetch especulativo de tools CIE-10.
+
+Antes de la primera llamada a Ollama se clasifica el prompt con reglas
+baratas: códigos CIE-10 literales ("E10", "I21.9") -> get_cie10_code y
+términos de enfermedad evidentes -> search_cie10. Esas búsquedas corren
+en paralelo con la generación; si el modelo luego pide el mismo tool
+call, el resultado ya está listo. Lo no usado se cancela al terminar.
+"""
+import asyncio
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .arguments import ArgumentsKey, ToolArgumentError
+from .registry import get_tool_registry
+from .runner import ToolCall, run_tool_call
+
+PREFETCH_SEARCH_LIMIT = 10
+
+CODE_RE = re.compile(r"\b([A-Z]\d{2}(?:\.\d{1,2})?)\b", re.IGNORECASE)
+# "código de diabetes", "codigo cie-10 para la neumonía", ...
+QUERY_RE = re.compile(
+    r"c[oó]digos?\s+(?:cie-?10\s+)?(?:de|del|para)\s+(?:la\s+|el\s+|los\s+|las\s+|una?\s+)?"
+    r"([a-záéíóúüñ][a-záéíóúüñ ]{2,40}?)\s*(?:[?.,;:!]|$)",
+    re.IGNORECASE,
+)
+COMMON_TERMS = (
+    "diabetes", "hipertensión", "hipertension", "asma", "neumonía", "neumonia", "migraña",
+    "infarto", "epoc", "obesidad", "depresión", "depresion", "ansiedad", "cáncer", "cancer",
+    "covid", "influenza", "gastritis", "lumbago", "anemia", "tuberculosis", "apendicitis",
+)
+TERM_RE = re.compile(r"\b(" + "|".join(COMMON_TERMS) + r")\b", re.IGNORECASE)
+
+
+def predict_tool_calls(prompt: str, max_calls: int) -> List[ToolCall]:
+    """Tool calls probables para el prompt (códigos primero, luego términos)"""
+    calls: List[ToolCall] = []
+    seen: Set[Tuple[str, ArgumentsKey]] = set()
+
+    def add(call: ToolCall) -> None:
+        key = prefetch_key(call)
+        if key is not None and key not in seen and len(calls) < max_calls:
+            seen.add(key)
+            calls.append(call)
+
+    for match in CODE_RE.finditer(prompt):
+        add(ToolCall("get_cie10_code", {"code": match.group(1)}))
+    for match in QUERY_RE.finditer(prompt):
+        add(ToolCall("search_cie10", {"query": match.group(1), "limit": PREFETCH_SEARCH_LIMIT}))
+    for match in TERM_RE.finditer(prompt):
+        add(ToolCall("search_cie10", {"query": match.group(1), "limit": PREFETCH_SEARCH_LIMIT}))
+    return calls
+
+
+def prefetch_key(call: ToolCall) -> Optional[Tuple[str, ArgumentsKey]]:
+    """Identidad de un tool call (argumentos normalizados, sin limit) para emparejar con lo pre-cargado"""
+    try:
+        _, key = get_tool_registry().normalize(call.name, call.arguments)
+    except ToolArgumentError:
+        return None
+    return call.name, tuple(item for item in key if item[0] != "limit")
+
+
+class ToolPrefetcher:
+    """Búsquedas lanzadas especulativamente durante una respuesta de /chat"""
+
+    def __init__(self, calls: List[ToolCall]):
+        self._tasks: Dict[Tuple[str, ArgumentsKey], asyncio.Task] = {}
+        self.hits = 0
+        for call in calls:
+            key = prefetch_key(call)
+            if key is not None:
+                self._tasks[key] = asyncio.create_task(run_tool_call(call))
+        self.started = len(self._tasks)
+
+    async def take(self, call: ToolCall) -> Optional[Dict[str, Any]]:
+        """Resultado pre-cargado equivalente a call, o None si no se anticipó"""
+        key = prefetch_key(call)
+        task = self._tasks.get(key) if key is not None else None
+        if task is None:
+            return None
+        if call.name == "search_cie10":
+            normalized, _ = get_tool_registry().normalize(call.name, call.arguments)
+            limit = normalized.get("limit", PREFETCH_SEARCH_LIMIT)
+            if limit > PREFETCH_SEARCH_LIMIT:
+                return None
+        del self._tasks[key]  # type: ignore[arg-type]
+        result = await task
+        self.hits += 1
+        if call.name == "search_cie10" and isinstance(result.get("data"), list):
+            result = {**result, "data": result["data"][:limit], "query": call.arguments.get("query")}
+        return result
+
+    def cancel(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
@@ -1,20 +1,193 @@
 """
 Registro centralizado de herramientas disponibles para Qwen
+
+Cada tool se declara con un ToolSpec: schema (formato OpenAI/Qwen),
+handler async, timeout, TTL del cache de resultados y concurrencia
+máxima. El schema se compila al registrar la tool (ver arguments.py):
+los argumentos se validan y normalizan antes de ejecutar y la tupla
+normalizada es la clave del cache de resultados. El loop de /chat
+despacha por nombre con ToolRegistry.execute, que aplica esos límites
+(la espera por cupo cuenta dentro del timeout, así una tool lenta no
+alarga la cola de latencia de /chat) y lleva contadores de latencia y
+errores por tool (ver /admin/engine).
 """
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
 
-# Definiciones de tools en formato estándar OpenAI/Qwen
-AVAILABLE_TOOLS = [
-    {
-        "type": "function",
-        "function": {
-            "name": "search_cie10",
-            "description": "Busca códigos CIE-10 (Clasificación Internacional de Enfermedades) por término médico en español. Retorna una lista de códigos relevantes con sus descripciones.",
-            "parameters": {
+from ..config import get_settings
+from ..telemetry import percentile
+from .arguments import (
+    ArgumentsKey, CompiledArguments, Normalizer, ToolArgumentError, compile_arguments, fold_accents,
+    fold_whitespace, normalize_code,
+)
+from ..cie10_service import get_cie10_service
+from .cie10_tools import format_cie10_result, get_cie10_code_tool, search_cie10_tool
+
+logger = logging.getLogger("energyapp.tools")
+
+LATENCY_WINDOW = 256  # latencias recientes por tool para p50/p95
+RESULT_CACHE_MAX_ENTRIES = 256
+
+
+@dataclass
+class ToolSpec:
+    name: str
+    description: str
+    parameters: Dict[str, Any]
+    handler: Callable[..., Awaitable[Dict[str, Any]]]
+    timeout: Optional[float] = None  # None: chat_tool_timeout_seconds
+    cache_ttl: float = 0.0  # 0: sin cache de resultados
+    max_concurrency: int = 4
+    formatter: Optional[Callable[[Dict[str, Any]], str]] = None  # texto para el usuario
+    normalizers: Dict[str, Normalizer] = field(default_factory=dict)  # por argumento, antes de ejecutar
+    folds: Dict[str, Normalizer] = field(default_factory=dict)  # por argumento, solo clave de cache
+    # Estado en runtime
+    calls: int = 0
+    errors: int = 0
+    invalid: int = 0
+    timeouts: int = 0
+    cache_hits: int = 0
+    in_flight: int = 0
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=LATENCY_WINDOW))
+    _semaphore: Optional[asyncio.Semaphore] = None
+    _arguments: Optional[CompiledArguments] = None
+    _cache: "OrderedDict[ArgumentsKey, Tuple[float, Dict[str, Any]]]" = field(default_factory=OrderedDict)
+
+    def definition(self) -> Dict[str, Any]:
+        return {
+            "type": "function",
+            "function": {
+                "name": self.name,
+                "description": self.description,
+                "parameters": self.parameters,
+            },
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        ordered = sorted(self.latencies)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "invalid": self.invalid,
+            "timeouts": self.timeouts,
+            "cache_hits": self.cache_hits,
+            "cache_entries": len(self._cache),
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "latency_ms": {
+                "p50": percentile(ordered, 50),
+                "p95": percentile(ordered, 95),
+                "max": ordered[-1],
+            } if ordered else None,
+        }
+
+
+class ToolRegistry:
+    """Tools por nombre + ejecución con timeout, cache y límite de concurrencia"""
+
+    def __init__(self, default_timeout: float):
+        self.default_timeout = default_timeout
+        self._specs: Dict[str, ToolSpec] = {}
+
+    def register(self, spec: ToolSpec) -> None:
+        spec._semaphore = asyncio.Semaphore(spec.max_concurrency)
+        spec._arguments = compile_arguments(spec.parameters, spec.normalizers, spec.folds)
+        self._specs[spec.name] = spec
+
+    def normalize(self, name: str, arguments: Any) -> Tuple[Dict[str, Any], ArgumentsKey]:
+        """Argumentos validados y normalizados + su clave de cache"""
+        spec = self._specs.get(name)
+        if spec is None:
+            raise ToolArgumentError(f"Tool desconocida: {name}")
+        normalized = spec._arguments.validate(arguments)  # type: ignore[union-attr]
+        return normalized, spec._arguments.key(normalized)  # type: ignore[union-attr]
+
+    def get(self, name: str) -> Optional[ToolSpec]:
+        return self._specs.get(name)
+
+    def definitions(self) -> List[Dict[str, Any]]:
+        return [spec.definition() for spec in self._specs.values()]
+
+    def format_result(self, name: str, result: Dict[str, Any]) -> str:
+        spec = self._specs.get(name)
+        if spec is not None and spec.formatter is not None:
+            return spec.formatter(result)
+        if not result.get("success"):
+            return f"\nError: {result.get('error')}\n"
+        return "\n"
+
+    async def execute(self, name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        spec = self._specs.get(name)
+        if spec is None:
+            return {"success": False, "error": f"Tool desconocida: {name}"}
+
+        try:
+            normalized, key = self.normalize(name, arguments)
+        except ToolArgumentError as exc:
+            spec.invalid += 1
+            return {"success": False, "error": f"Argumentos inválidos: {exc}"}
+        if spec.cache_ttl > 0:
+            cached = spec._cache.get(key)
+            if cached is not None and cached[0] > time.monotonic():
+                spec._cache.move_to_end(key)
+                spec.cache_hits += 1
+                return cached[1]
+
+        timeout = spec.timeout if spec.timeout is not None else self.default_timeout
+        spec.calls += 1
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(self._run(spec, normalized), timeout)
+        except asyncio.TimeoutError:
+            spec.timeouts += 1
+            logger.warning(f"TOOL_TIMEOUT | name={name}, timeout={timeout}")
+            return {"success": False, "error": f"Tiempo de espera agotado ({timeout}s)"}
+        except Exception as exc:
+            spec.errors += 1
+            logger.warning(f"TOOL_FAILED | name={name}, error={exc}")
+            return {"success": False, "error": str(exc)}
+        finally:
+            spec.latencies.append(round((time.monotonic() - started) * 1000, 1))
+
+        # Un resultado vacío puede deberse a datos aún no cargados: no se cachea
+        if spec.cache_ttl > 0 and result.get("success") and result.get("data") not in (None, [], {}):
+            spec._cache[key] = (time.monotonic() + spec.cache_ttl, result)
+            spec._cache.move_to_end(key)
+            while len(spec._cache) > RESULT_CACHE_MAX_ENTRIES:
+                spec._cache.popitem(last=False)
+        return result
+
+    @staticmethod
+    async def _run(spec: ToolSpec, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        async with spec._semaphore:  # type: ignore[union-attr]
+            spec.in_flight += 1
+            try:
+                return await spec.handler(**arguments)
+            finally:
+                spec.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: spec.stats() for name, spec in self._specs.items()}
+
+
+def cie10_tool_specs(fold_queries: bool = False) -> List[ToolSpec]:
+    """fold_queries: el servicio CIE-10 ignora tildes y la clave de cache puede plegarlas"""
+    return [
+        ToolSpec(
+            name="search_cie10",
+            description="Busca códigos CIE-10 (Clasificación Internacional de Enfermedades) por término médico en español. Retorna una lista de códigos relevantes con sus descripciones.",
+            parameters={
                 "type": "object",
                 "properties": {
                     "query": {
                         "type": "string",
-                        "description": "Término de búsqueda médico (enfermedad, síntoma, diagnóstico). Ejemplo: 'diabetes', 'hipertensión', 'migraña'"
+                        "description": "Término de búsqueda médico (enfermedad, síntoma, diagnóstico). Ejemplo: 'diabetes', 'hipertensión', 'migraña'",
+                        "minLength": 2,
+                        "maxLength": 100
                     },
                     "limit": {
                         "type": "integer",
@@ -25,29 +198,54 @@ AVAILABLE_TOOLS = [
                     }
                 },
                 "required": ["query"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "get_cie10_code",
-            "description": "Obtiene información detallada de un código CIE-10 específico. Útil cuando el usuario proporciona un código exacto o cuando ya sabes el código a consultar.",
-            "parameters": {
+            },
+            handler=search_cie10_tool,
+            cache_ttl=300.0,
+            max_concurrency=8,
+            formatter=format_cie10_result,
+            normalizers={"query": fold_whitespace},
+            folds={"query": fold_accents} if fold_queries else {},
+        ),
+        ToolSpec(
+            name="get_cie10_code",
+            description="Obtiene información detallada de un código CIE-10 específico. Útil cuando el usuario proporciona un código exacto o cuando ya sabes el código a consultar.",
+            parameters={
                 "type": "object",
                 "properties": {
                     "code": {
                         "type": "string",
-                        "description": "Código CIE-10 exacto. Ejemplos: 'E10', 'I10', 'A00', 'J11'"
+                        "description": "Código CIE-10 exacto. Ejemplos: 'E10', 'I10', 'A00', 'J11'",
+                        "maxLength": 10
                     }
                 },
                 "required": ["code"]
-            }
-        }
-    }
-]
+            },
+            handler=get_cie10_code_tool,
+            cache_ttl=300.0,
+            max_concurrency=8,
+            formatter=format_cie10_result,
+            normalizers={"code": normalize_code},
+        ),
+    ]
+
+
+# Definiciones de tools en formato estándar OpenAI/Qwen
+AVAILABLE_TOOLS = [spec.definition() for spec in cie10_tool_specs()]
+
+
+# Singleton
+_registry: Optional[ToolRegistry] = None
+
+
+def get_tool_registry() -> ToolRegistry:
+    global _registry
+    if _registry is None:
+        _registry = ToolRegistry(default_timeout=get_settings().chat_tool_timeout_seconds)
+        for spec in cie10_tool_specs(fold_queries=get_cie10_service().folds_accents):
+            _registry.register(spec)
+    return _registry
 
 
 def get_tool_definitions() -> list:
     """Retorna las definiciones de todas las herramientas disponibles"""
-    return AVAILABLE_TOOLS
+    return get_tool_registry().definitions()
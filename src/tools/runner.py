@@ -0,0 +1,75 @@
+"""
+Ejecución de los tool calls de una ronda del modelo.
+
+Todos los tool calls de una respuesta se ejecutan en paralelo via el
+registro de tools (timeout, cache y cupo por tool): varias búsquedas
+cuestan una sola espera. Los resultados
+vuelven al modelo como mensajes role=tool para la ronda siguiente.
+"""
+import asyncio
+import json
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from .registry import get_tool_registry
+
+if TYPE_CHECKING:
+    from .prefetch import ToolPrefetcher
+
+
+@dataclass
+class ToolCall:
+    name: str
+    arguments: Dict[str, Any]
+
+
+def parse_tool_calls(raw_calls: List[Dict[str, Any]]) -> List[ToolCall]:
+    """tool_calls de Ollama ({function: {name, arguments}}); arguments puede venir como JSON string"""
+    calls: List[ToolCall] = []
+    for raw in raw_calls:
+        function = raw.get("function", {})
+        arguments = function.get("arguments", {})
+        if isinstance(arguments, str):
+            try:
+                arguments = json.loads(arguments)
+            except json.JSONDecodeError:
+                arguments = {}
+        calls.append(ToolCall(name=function.get("name") or "", arguments=arguments or {}))
+    return calls
+
+
+async def run_tool_call(call: ToolCall) -> Dict[str, Any]:
+    return await get_tool_registry().execute(call.name, call.arguments)
+
+
+async def run_tool_calls(
+    calls: List[ToolCall],
+    prefetcher: Optional["ToolPrefetcher"] = None,
+) -> List[Dict[str, Any]]:
+    """Resultados en el mismo orden que calls; usa lo pre-cargado cuando coincide"""
+
+    async def run(call: ToolCall) -> Dict[str, Any]:
+        if prefetcher is not None:
+            result = await prefetcher.take(call)
+            if result is not None:
+                return result
+        return await run_tool_call(call)
+
+    return list(await asyncio.gather(*(run(call) for call in calls)))
+
+
+def tool_round_messages(
+    content: str,
+    raw_calls: List[Dict[str, Any]],
+    calls: List[ToolCall],
+    results: List[Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    """Mensaje del asistente con sus tool_calls + un mensaje role=tool por resultado"""
+    messages: List[Dict[str, Any]] = [{"role": "assistant", "content": content, "tool_calls": raw_calls}]
+    for call, result in zip(calls, results):
+        messages.append({
+            "role": "tool",
+            "tool_name": call.name,
+            "content": json.dumps(result, ensure_ascii=False, default=str),
+        })
+    return messages
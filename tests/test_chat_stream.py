@@ -0,0 +1,70 @@
+"""Agrupación de tokens del stream de /chat (coalesce_events)."""
+import asyncio
+from typing import List
+
+from src.chat_stream import ChatEvent, coalesce_events
+
+
+def collect(source, max_delay: float = 0.05, max_bytes: int = 64) -> List[List[ChatEvent]]:
+    async def run() -> List[List[ChatEvent]]:
+        return [batch async for batch in coalesce_events(source, max_delay, max_bytes)]
+
+    return asyncio.run(run())
+
+
+def test_tokens_are_merged_and_other_events_flush_them():
+    async def source():
+        for token in ("Ho", "la", " mundo"):
+            yield ChatEvent("token", {"content": token})
+        yield ChatEvent("done", {})
+
+    batches = collect(source())
+    assert [[(e.type, e.data) for e in batch] for batch in batches] == [
+        [("token", {"content": "Hola mundo"}), ("done", {})],
+    ]
+
+
+def test_max_bytes_splits_frames():
+    async def source():
+        for _ in range(10):
+            yield ChatEvent("token", {"content": "abcd"})
+
+    batches = collect(source(), max_bytes=8)
+    assert [batch[0].data["content"] for batch in batches] == ["abcdabcd"] * 5
+
+
+def test_source_errors_propagate():
+    async def source():
+        yield ChatEvent("token", {"content": "a"})
+        raise RuntimeError("boom")
+
+    try:
+        collect(source())
+    except RuntimeError as exc:
+        assert str(exc) == "boom"
+    else:
+        raise AssertionError("se esperaba RuntimeError")
+
+
+def test_frames_are_counted_before_the_source_finishes_on_cache_replay():
+    """Un hit de cache produce todos los tokens sin esperar: el usage final ya debe contar los frames"""
+    frames = 0
+
+    def count_frame() -> None:
+        nonlocal frames
+        frames += 1
+
+    async def cached_replay():
+        for _ in range(200):
+            yield ChatEvent("token", {"content": "tok "})
+        yield ChatEvent("usage", {"token_chunks": 200, "token_frames": frames})
+
+    async def run() -> List[List[ChatEvent]]:
+        return [batch async for batch in coalesce_events(cached_replay(), 0.05, 64, count_frame)]
+
+    batches = asyncio.run(run())
+    token_batches = [e for batch in batches for e in batch if e.type == "token"]
+    usage = [e for batch in batches for e in batch if e.type == "usage"][0]
+    assert usage.data["token_frames"] > 0
+    assert usage.data["token_frames"] == len(token_batches) == frames
+    assert "".join(e.data["content"] for e in token_batches) == "tok " * 200
@@ -0,0 +1,70 @@
+"""Índice CIE-10 en memoria: ranking de búsqueda y reconstrucción."""
+import asyncio
+import time
+
+import pytest
+
+from src import cie10_index
+from src.cie10_index import CSV_PATH, CIE10Index, CIE10IndexHolder, _load_rows_from_csv
+from src.text_normalize import search_terms
+
+
+@pytest.fixture(scope="module")
+def index() -> CIE10Index:
+    return CIE10Index(_load_rows_from_csv(CSV_PATH))
+
+
+def codes(index: CIE10Index, query: str, limit: int = 5):
+    return [doc["code"] for doc in index.search(query, limit)]
+
+
+def test_single_digits_are_search_terms():
+    assert search_terms("diabetes tipo 2") == ["diabet", "tipo", "2"]
+    assert "y" not in search_terms("diabetes y asma")
+
+
+def test_diabetes_type_2_ranks_e11_first(index):
+    assert codes(index, "diabetes tipo 2")[0] == "E11"
+    assert codes(index, "Diabetes mellitus tipo II")[0] == "E11"
+
+
+def test_diabetes_type_1_and_2_differ(index):
+    assert codes(index, "diabetes tipo 1")[0] == "E10"
+    assert codes(index, "diabetes tipo 1") != codes(index, "diabetes tipo 2")
+
+
+def test_informative_term_beats_frequent_one(index):
+    """Sin documento que cubra todo, "diabetes" pesa más que "tipos" en descripciones cortas"""
+    top = index.search("diabetes tipo", 3)
+    assert all("iabetes" in doc["description"] for doc in top)
+
+
+def test_accents_and_plurals_are_folded(index):
+    assert codes(index, "hipertension", 3) == codes(index, "Hipertensión", 3)
+    assert "J159" in codes(index, "neumonias bacterianas", 5)
+
+
+def test_code_queries_use_exact_then_prefix(index):
+    assert codes(index, "e11", 3) == ["E11", "E110", "E111"]
+    assert index.get_code("E10.9")["code"] == "E109"
+
+
+def test_invalidate_during_build_discards_the_stale_index(monkeypatch):
+    builds = []
+
+    def fake_build():
+        builds.append(len(builds) + 1)
+        time.sleep(0.05)
+        return f"index-{len(builds)}"
+
+    monkeypatch.setattr(cie10_index, "build_index", fake_build)
+
+    async def run():
+        holder = CIE10IndexHolder()
+        pending = asyncio.ensure_future(holder.get())
+        await asyncio.sleep(0.01)
+        holder.invalidate()  # la tabla se recargó mientras se construía
+        return await pending, await holder.get()
+
+    assert asyncio.run(run()) == ("index-2", "index-2")
+    assert builds == [1, 2]
@@ -0,0 +1,197 @@
+"""Streams de /chat reanudables e Idempotency-Key (stream_registry)."""
+import asyncio
+import json
+from typing import List
+
+import pytest
+
+from src.chat_stream import ChatEvent
+from src.stream_registry import ChatStream, StreamGone, StreamRegistry, request_fingerprint, stream_body
+
+
+class FakeRequest:
+    """Request ASGI cuyo cliente se desconecta al setear disconnected"""
+
+    def __init__(self) -> None:
+        self.disconnected = asyncio.Event()
+
+    async def receive(self):
+        await self.disconnected.wait()
+        return {"type": "http.disconnect"}
+
+
+def tokens(*contents: str) -> List[ChatEvent]:
+    return [ChatEvent("token", {"content": content}) for content in contents]
+
+
+async def drain(stream: ChatStream, offset: int = 0) -> List[ChatEvent]:
+    return [event async for batch in stream.subscribe(offset) for event in batch]
+
+
+def test_events_are_numbered_and_replayed_from_offset():
+    async def run():
+        stream = ChatStream("s", 1, 1, max_events=10, grace_seconds=1.0)
+
+        async def source():
+            yield tokens("a", "b")
+            yield [ChatEvent("done", {})]
+
+        stream.start(source())
+        full = await drain(stream)
+        tail = await drain(stream, offset=1)
+        return full, tail
+
+    full, tail = asyncio.run(run())
+    assert [(e.seq, e.type) for e in full] == [(0, "token"), (1, "token"), (2, "done")]
+    assert [e.seq for e in tail] == [1, 2]
+
+
+def test_late_subscriber_gets_replay_then_live_tail():
+    async def run():
+        stream = ChatStream("s", 1, 1, max_events=10, grace_seconds=1.0)
+        release = asyncio.Event()
+
+        async def source():
+            yield tokens("a")
+            await release.wait()
+            yield tokens("b")
+
+        stream.start(source())
+        await asyncio.sleep(0)
+        reader = asyncio.ensure_future(drain(stream))
+        await asyncio.sleep(0.01)
+        release.set()
+        return await reader
+
+    events = asyncio.run(run())
+    assert [e.data["content"] for e in events] == ["a", "b"]
+
+
+def test_offset_outside_the_ring_buffer_is_gone():
+    async def run():
+        stream = ChatStream("s", 1, 1, max_events=2, grace_seconds=1.0)
+
+        async def source():
+            yield tokens("a", "b", "c", "d")
+
+        stream.start(source())
+        await drain(stream, offset=2)
+        assert stream.first_seq == 2
+        with pytest.raises(StreamGone):
+            await drain(stream, offset=0)
+
+    asyncio.run(run())
+
+
+def test_stream_body_ends_lagging_subscriber_with_error_frame():
+    async def run():
+        stream = ChatStream("s", 1, 1, max_events=2, grace_seconds=1.0)
+        produced = asyncio.Event()
+
+        async def source():
+            yield tokens("a")
+            await produced.wait()
+            yield tokens("b", "c", "d", "e")
+
+        stream.start(source())
+        chunks = []
+        async for chunk in stream_body(FakeRequest(), stream, 0, "ndjson"):
+            chunks.append(chunk)
+            produced.set()
+            await asyncio.sleep(0.01)  # el suscriptor se atrasa: el buffer rota
+        return chunks
+
+    chunks = asyncio.run(run())
+    last = json.loads(chunks[-1])
+    assert last["type"] == "error" and last["code"] == "stream_gone"
+
+
+def test_generation_survives_disconnect_and_is_abandoned_after_grace():
+    async def run():
+        stream = ChatStream("s", 1, 1, max_events=10, grace_seconds=0.05)
+        cancelled = asyncio.Event()
+
+        async def source():
+            try:
+                yield tokens("a")
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        stream.start(source())
+        request = FakeRequest()
+        body = stream_body(request, stream, 0, "text")
+        assert await body.__anext__() == "a"
+        request.disconnected.set()
+        with pytest.raises(StopAsyncIteration):
+            await body.__anext__()
+        assert not stream.done  # sigue generando, esperando un re-enganche
+        await asyncio.wait_for(cancelled.wait(), 1.0)
+        await asyncio.sleep(0)
+        return stream.done
+
+    assert asyncio.run(run()) is True
+
+
+def test_resubscribing_within_grace_keeps_the_generation():
+    async def run():
+        stream = ChatStream("s", 1, 1, max_events=10, grace_seconds=0.05)
+        release = asyncio.Event()
+
+        async def source():
+            yield tokens("a")
+            await release.wait()
+            yield tokens("b")
+
+        stream.start(source())
+        first = stream.subscribe(0)
+        await first.__anext__()
+        await first.aclose()  # el cliente se cae
+        resumed = asyncio.ensure_future(drain(stream, offset=1))
+        await asyncio.sleep(0.1)  # más que el grace: el re-enganche canceló el abandono
+        release.set()
+        return await resumed
+
+    assert [e.data["content"] for e in asyncio.run(run())] == ["b"]
+
+
+def test_idempotency_keys_are_per_user_and_expire():
+    async def run():
+        registry = StreamRegistry(max_events=10, grace_seconds=1.0, retention_seconds=60.0, idempotency_ttl=0.05)
+        stream = registry.create(user_id=1, conversation_id=7)
+        registry.remember_idempotent(1, "key", request_fingerprint({"prompt": "hola"}), stream)
+        entry = registry.lookup_idempotent(1, "key")
+        other_user = registry.lookup_idempotent(2, "key")
+        await asyncio.sleep(0.1)
+        return stream, entry, other_user, registry.lookup_idempotent(1, "key")
+
+    stream, entry, other_user, expired = asyncio.run(run())
+    assert entry is not None and entry.stream_id == stream.id and entry.conversation_id == 7
+    assert entry.fingerprint == request_fingerprint({"prompt": "hola"})
+    assert other_user is None
+    assert expired is None
+
+
+def test_fingerprint_ignores_key_order_but_not_content():
+    assert request_fingerprint({"a": 1, "b": 2}) == request_fingerprint({"b": 2, "a": 1})
+    assert request_fingerprint({"prompt": "hola"}) != request_fingerprint({"prompt": "chao"})
+
+
+def test_finished_streams_are_retained_then_purged():
+    async def run():
+        registry = StreamRegistry(max_events=10, grace_seconds=1.0, retention_seconds=0.05, idempotency_ttl=60.0)
+        stream = registry.create(user_id=1, conversation_id=1)
+
+        async def source():
+            yield tokens("a")
+
+        stream.start(source())
+        await drain(stream)
+        retained = registry.get(stream.id)
+        await asyncio.sleep(0.1)
+        return retained, registry.get(stream.id)
+
+    retained, purged = asyncio.run(run())
+    assert retained is not None
+    assert purged is None
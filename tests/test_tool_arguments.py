@@ -0,0 +1,93 @@
+"""Validación y normalización de argumentos de tools (schema compilado)."""
+import asyncio
+
+import pytest
+
+from src.tools.arguments import ToolArgumentError, compile_arguments, fold_whitespace, normalize_code
+from src.tools.registry import ToolRegistry, ToolSpec, cie10_tool_specs
+from src.text_normalize import fold_accents
+
+SEARCH_PARAMETERS = cie10_tool_specs()[0].parameters
+
+
+@pytest.fixture
+def search_arguments():
+    return compile_arguments(SEARCH_PARAMETERS, {"query": fold_whitespace}, {"query": fold_accents})
+
+
+def test_coerces_types_and_clamps_to_limits(search_arguments):
+    assert search_arguments.validate({"query": "  asma   bronquial ", "limit": "10"}) == {
+        "query": "asma bronquial", "limit": 10,
+    }
+    assert search_arguments.validate({"query": "asma", "limit": 500})["limit"] == 50
+    assert search_arguments.validate({"query": "asma", "limit": 0})["limit"] == 1
+    assert search_arguments.validate({"query": "asma", "limit": 7.9})["limit"] == 7
+
+
+def test_defaults_and_unknown_keys(search_arguments):
+    assert search_arguments.validate({"query": "asma", "extra": True}) == {"query": "asma", "limit": 10}
+
+
+@pytest.mark.parametrize("arguments", [
+    {},
+    {"query": ""},
+    {"query": "a"},
+    {"query": ["asma"]},
+    {"query": "asma", "limit": True},
+    {"query": "asma", "limit": "diez"},
+    "asma",
+])
+def test_rejects_invalid_arguments(search_arguments, arguments):
+    with pytest.raises(ToolArgumentError):
+        search_arguments.validate(arguments)
+
+
+@pytest.mark.parametrize("limit", ["1e400", "inf", "-inf", "nan", float("inf"), float("nan")])
+def test_non_finite_numbers_are_argument_errors(search_arguments, limit):
+    with pytest.raises(ToolArgumentError):
+        search_arguments.validate({"query": "asma", "limit": limit})
+
+
+def test_number_type_rejects_non_finite():
+    arguments = compile_arguments({"properties": {"x": {"type": "number"}}, "required": ["x"]})
+    assert arguments.validate({"x": "1.5"}) == {"x": 1.5}
+    for value in ("nan", "1e400", float("inf")):
+        with pytest.raises(ToolArgumentError):
+            arguments.validate({"x": value})
+
+
+def test_cache_key_folds_only_with_fold(search_arguments):
+    folded = search_arguments.key(search_arguments.validate({"query": "Hipertensión"}))
+    plain = compile_arguments(SEARCH_PARAMETERS, {"query": fold_whitespace})
+    assert folded == search_arguments.key(search_arguments.validate({"query": "hipertension"}))
+    assert plain.key(plain.validate({"query": "Hipertensión"})) != plain.key(plain.validate({"query": "hipertension"}))
+
+
+def test_code_normalizer():
+    assert normalize_code(" e10.9 ") == "E10.9"
+
+
+def test_registry_reports_invalid_arguments_without_calling_the_handler():
+    calls = []
+
+    async def handler(query: str, limit: int = 10):
+        calls.append((query, limit))
+        return {"success": True, "data": [query]}
+
+    registry = ToolRegistry(default_timeout=1.0)
+    registry.register(ToolSpec(
+        name="search", description="", parameters=SEARCH_PARAMETERS, handler=handler, cache_ttl=60.0,
+    ))
+
+    async def run():
+        invalid = await registry.execute("search", {"query": "asma", "limit": "1e400"})
+        first = await registry.execute("search", {"query": "asma", "limit": "3"})
+        cached = await registry.execute("search", {"query": "asma", "limit": 3})
+        return invalid, first, cached
+
+    invalid, first, cached = asyncio.run(run())
+    assert invalid["success"] is False and "Argumentos inválidos" in invalid["error"]
+    assert first == cached == {"success": True, "data": ["asma"]}
+    assert calls == [("asma", 3)]
+    assert registry.stats()["search"]["invalid"] == 1
+    assert registry.stats()["search"]["cache_hits"] == 1